@@ -8,6 +8,22 @@ from flask import Flask, render_template, request, abort
 import os
 from dotenv import load_dotenv
 
+try:
+    import orjson
+    from flask.json.provider import JSONProvider
+
+    class OrjsonProvider(JSONProvider):
+        """Serve jsonify() through orjson; large payloads (distinct values,
+        config listings, batch results) serialize several times faster"""
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+except ImportError:
+    orjson = None
+
 # Import database initialization
 from database.db import init_db, migrate_db
 
@@ -31,6 +47,9 @@ load_dotenv()
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 
+if orjson:
+    app.json = OrjsonProvider(app)
+
 # Initialize audit logger
 audit_logger = get_audit_logger()
 
@@ -134,24 +153,8 @@ def get_sf_client():
     return sf_client
 
 
-def load_settings():
-    """Load settings from settings.json file"""
-    import json
-    settings_file = 'settings.json'
-    if os.path.exists(settings_file):
-        with open(settings_file, 'r') as f:
-            settings = json.load(f)
-    else:
-        # Default settings from environment
-        settings = {
-            'provider': os.getenv('LLM_PROVIDER', 'lm_studio'),
-            'endpoint': os.getenv('LM_STUDIO_ENDPOINT', 'http://localhost:1234'),
-            'model': os.getenv('LLM_MODEL', 'gpt-4o-mini'),
-            'temperature': float(os.getenv('LLM_TEMPERATURE', '0.7')),
-            'max_tokens': int(os.getenv('LLM_MAX_TOKENS', '4000')),
-            'timeout': 60
-        }
-    return settings
+# Settings come through the shared mtime-cached loader
+from utils.settings_utils import load_settings
 
 
 # Configure blueprints with client accessor functions
@@ -5,6 +5,8 @@ Tracks all PHI access, modifications, and security events for HIPAA compliance
 
 import json
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from functools import wraps
 from flask import request, g
@@ -32,8 +34,27 @@ class AuditLogger:
         """Initialize audit logger"""
         self.log_file = log_file
         self.logger = self._setup_logger()
+        # Per-thread batch connection set by batch(); when present, log()
+        # writes through it and defers the commit to the context exit
+        self._batch_local = threading.local()
         self._init_db()
 
+    @contextmanager
+    def batch(self):
+        """Group several log calls into one DB transaction
+
+        Each log() normally pays its own commit (an fsync); wrapping a burst
+        of events in batch() amortizes that to a single commit on exit.
+        """
+        conn = get_connection()
+        self._batch_local.conn = conn
+        try:
+            yield
+            conn.commit()
+        finally:
+            self._batch_local.conn = None
+            conn.close()
+
     def _setup_logger(self):
         """Setup JSON structured logging"""
         import os
@@ -156,7 +177,8 @@ class AuditLogger:
 
         # Store in database
         try:
-            conn = get_connection()
+            batch_conn = getattr(self._batch_local, 'conn', None)
+            conn = batch_conn if batch_conn is not None else get_connection()
             c = conn.cursor()
 
             c.execute('''
@@ -181,8 +203,9 @@ class AuditLogger:
                 timestamp
             ))
 
-            conn.commit()
-            conn.close()
+            if batch_conn is None:
+                conn.commit()
+                conn.close()
         except Exception as e:
             # Log database error but don't fail the request
             print(f"[AUDIT] Failed to write to database: {e}")
@@ -1,26 +1,152 @@
 """
 Database initialization and management for Clinical Genius application
 """
+import csv
+import io
 import sqlite3
 import os
+import queue
+import threading
+from contextlib import contextmanager
 
 
 DB_NAME = 'analysis_batches.db'
 USE_ENCRYPTION = os.getenv('DB_ENCRYPTION', 'true').lower() == 'true'
+POOL_SIZE = 5
 
 
-def get_connection():
-    """Get a database connection (encrypted if encryption is enabled)"""
+def _open_connection():
+    """Open a new database connection (encrypted if encryption is enabled)"""
     if USE_ENCRYPTION:
         try:
             from database.encryption import get_encrypted_connection
-            return get_encrypted_connection(DB_NAME)
+            # Pooled connections are handed across request threads, so the
+            # encrypted path needs check_same_thread=False just like the
+            # unencrypted connect below
+            conn = get_encrypted_connection(DB_NAME, check_same_thread=False)
         except Exception as e:
             print(f"[WARNING] Failed to get encrypted connection: {e}")
             print("[WARNING] Falling back to unencrypted connection")
-            return sqlite3.connect(DB_NAME)
+            conn = sqlite3.connect(DB_NAME, check_same_thread=False, cached_statements=256)
     else:
-        return sqlite3.connect(DB_NAME)
+        conn = sqlite3.connect(DB_NAME, check_same_thread=False, cached_statements=256)
+
+    # Long-lived connection tuning: WAL lets readers run concurrently with the
+    # background batch writer, and the memory/mmap settings keep the hot page
+    # cache resident across requests instead of rebuilding it per connection.
+    # foreign_keys is per-connection in SQLite, so it must be enabled here for
+    # ON DELETE CASCADE to fire.
+    conn.execute('PRAGMA foreign_keys=ON')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA mmap_size=268435456')
+    return conn
+
+
+class ConnectionPool:
+    """Process-wide pool of long-lived SQLite connections
+
+    Opening a connection per request re-parses the schema and starts with a
+    cold page and statement cache. Pooled connections keep both caches hot,
+    so repeated endpoints are dominated by query execution instead of
+    connection setup. Connections are handed to one thread at a time; if the
+    pool is exhausted a transient overflow connection is opened and closed
+    for real on release.
+    """
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire_connection(self):
+        """Get a connection from the pool (or a transient overflow connection)"""
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return _open_connection(), True
+
+        # Pool exhausted: transient connection, closed for real on release
+        return _open_connection(), False
+
+    def release_connection(self, conn, pooled):
+        """Return a connection to the pool, resetting per-request state"""
+        broken = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+        except Exception:
+            # Connection is broken; drop it and let the pool refill
+            broken = True
+
+        if pooled and not broken:
+            self._idle.put(conn)
+            return
+
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+        if pooled:
+            # A pooled slot died; release its _created count so the pool can
+            # open a replacement. Transients never incremented the counter,
+            # so decrementing for them would let the pool grow past its size.
+            with self._lock:
+                self._created -= 1
+
+
+class PooledConnection:
+    """Connection handle returned by get_connection()
+
+    Looks like a plain sqlite3 connection, but close() releases back to the
+    pool instead of tearing the connection down, so existing
+    get_connection()/close() call sites get pooling for free.
+    """
+
+    def __init__(self, conn, pool, pooled):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_pooled', pooled)
+        object.__setattr__(self, '_released', False)
+
+    def close(self):
+        if not self._released:
+            object.__setattr__(self, '_released', True)
+            self._pool.release_connection(self._conn, self._pooled)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+
+_pool = ConnectionPool()
+
+
+def get_connection():
+    """Get a pooled database connection (encrypted if encryption is enabled)"""
+    conn, pooled = _pool.acquire_connection()
+    return PooledConnection(conn, _pool, pooled)
+
+
+@contextmanager
+def acquire():
+    """Context-manager access to a pooled connection"""
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
 
 
 def init_db():
@@ -71,10 +197,12 @@ def init_db():
             timeout INTEGER DEFAULT 60,
             created_at TEXT NOT NULL,
             updated_at TEXT NOT NULL,
-            FOREIGN KEY (batch_id) REFERENCES batches(id)
+            FOREIGN KEY (batch_id) REFERENCES batches(id) ON DELETE CASCADE
         )
     ''')
 
+    # csv_data lives in a side table so history listing only reads narrow
+    # rows; the multi-MB CSV blobs are touched solely by the download routes
     c.execute('''
         CREATE TABLE IF NOT EXISTS execution_history (
             batch_id TEXT PRIMARY KEY,
@@ -84,12 +212,44 @@ def init_db():
             success_count INTEGER NOT NULL,
             error_count INTEGER NOT NULL,
             execution_time REAL NOT NULL,
-            csv_data TEXT NOT NULL,
             executed_at TEXT NOT NULL,
             FOREIGN KEY (batch_id) REFERENCES batches(id) ON DELETE CASCADE
         )
     ''')
 
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS execution_history_csv (
+            batch_id TEXT PRIMARY KEY,
+            csv_data TEXT NOT NULL,
+            FOREIGN KEY (batch_id) REFERENCES batches(id) ON DELETE CASCADE
+        )
+    ''')
+
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_executed
+        ON execution_history(executed_at DESC)
+    ''')
+
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_dataset_executed
+        ON execution_history(dataset_name, executed_at DESC)
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS execution_results (
+            batch_id TEXT NOT NULL,
+            record_id TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            value TEXT,
+            FOREIGN KEY (batch_id) REFERENCES batches(id) ON DELETE CASCADE
+        )
+    ''')
+
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_execution_results_record
+        ON execution_results(record_id)
+    ''')
+
     c.execute('''
         CREATE TABLE IF NOT EXISTS execution_status (
             batch_id TEXT PRIMARY KEY,
@@ -135,4 +295,126 @@ def migrate_db():
         c.execute('ALTER TABLE dataset_configs ADD COLUMN picklist_fields TEXT')
         conn.commit()
 
+    # Check whether csv_data still lives inline in execution_history
+    c.execute("PRAGMA table_info(execution_history)")
+    history_columns = [col[1] for col in c.fetchall()]
+
+    if 'csv_data' in history_columns:
+        print("Running migration: Moving execution_history CSV blobs to side table")
+        # Pre-upgrade databases routinely hold history rows whose batch was
+        # deleted while PRAGMA foreign_keys was still off, and those rows are
+        # still listed and downloadable. Copying them into the FK'd tables
+        # below would fail with enforcement now on, so switch it off for the
+        # rebuild (the PRAGMA is per-connection and takes effect here because
+        # the preceding block left no open transaction).
+        c.execute('PRAGMA foreign_keys=OFF')
+        try:
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS execution_history_csv (
+                    batch_id TEXT PRIMARY KEY,
+                    csv_data TEXT NOT NULL,
+                    FOREIGN KEY (batch_id) REFERENCES batches(id) ON DELETE CASCADE
+                )
+            ''')
+            c.execute('''
+                INSERT OR REPLACE INTO execution_history_csv (batch_id, csv_data)
+                SELECT batch_id, csv_data FROM execution_history
+            ''')
+            c.execute('ALTER TABLE execution_history RENAME TO execution_history_old')
+            c.execute('''
+                CREATE TABLE execution_history (
+                    batch_id TEXT PRIMARY KEY,
+                    batch_name TEXT NOT NULL,
+                    dataset_name TEXT NOT NULL,
+                    total_records INTEGER NOT NULL,
+                    success_count INTEGER NOT NULL,
+                    error_count INTEGER NOT NULL,
+                    execution_time REAL NOT NULL,
+                    executed_at TEXT NOT NULL,
+                    FOREIGN KEY (batch_id) REFERENCES batches(id) ON DELETE CASCADE
+                )
+            ''')
+            c.execute('''
+                INSERT INTO execution_history
+                SELECT batch_id, batch_name, dataset_name, total_records,
+                       success_count, error_count, execution_time, executed_at
+                FROM execution_history_old
+            ''')
+            c.execute('DROP TABLE execution_history_old')
+            # Indexes were dropped with the renamed table; recreate them now
+            c.execute('CREATE INDEX IF NOT EXISTS idx_history_executed ON execution_history(executed_at DESC)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_history_dataset_executed ON execution_history(dataset_name, executed_at DESC)')
+            conn.commit()
+        finally:
+            c.execute('PRAGMA foreign_keys=ON')
+
+    # Backfill execution_results from legacy CSV blobs. History written
+    # before the normalized table existed has no rows there, so once any
+    # post-upgrade execution populates execution_results the combined export
+    # takes the SQL path and would silently drop the blob-only batches.
+    # Each blob is parsed once; subsequent startups find nothing to backfill.
+    c.execute('''
+        SELECT batch_id, csv_data FROM execution_history_csv
+        WHERE batch_id NOT IN (SELECT DISTINCT batch_id FROM execution_results)
+    ''')
+    legacy_blobs = c.fetchall()
+
+    if legacy_blobs:
+        print(f"Running migration: Backfilling execution_results from {len(legacy_blobs)} legacy CSV blob(s)")
+        # Legacy history can reference deleted batches (see the rebuild
+        # above), so foreign keys go off for the inserts as well
+        c.execute('PRAGMA foreign_keys=OFF')
+        try:
+            for batch_id, csv_data in legacy_blobs:
+                reader = csv.reader(io.StringIO(csv_data))
+                header = next(reader, None)
+                if not header or 'Record ID' not in header:
+                    continue
+
+                id_index = header.index('Record ID')
+                rows = []
+                for csv_row in reader:
+                    if id_index >= len(csv_row) or not csv_row[id_index]:
+                        continue
+                    record_id = csv_row[id_index]
+                    for i, value in enumerate(csv_row[:len(header)]):
+                        if i != id_index:
+                            rows.append((batch_id, record_id, header[i], value))
+
+                if rows:
+                    c.executemany('''
+                        INSERT INTO execution_results (batch_id, record_id, column_name, value)
+                        VALUES (?, ?, ?, ?)
+                    ''', rows)
+            conn.commit()
+        finally:
+            c.execute('PRAGMA foreign_keys=ON')
+
+    # Check that prompts cascades when its batch is deleted
+    c.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='prompts'")
+    prompts_sql = c.fetchone()
+
+    if prompts_sql and 'ON DELETE CASCADE' not in prompts_sql[0]:
+        print("Running migration: Rebuilding prompts table with ON DELETE CASCADE")
+        c.execute('ALTER TABLE prompts RENAME TO prompts_old')
+        c.execute('''
+            CREATE TABLE prompts (
+                batch_id TEXT PRIMARY KEY,
+                prompt_template TEXT NOT NULL,
+                response_schema TEXT,
+                schema_description TEXT,
+                provider TEXT DEFAULT 'lm_studio',
+                endpoint TEXT,
+                temperature REAL DEFAULT 0.7,
+                max_tokens INTEGER DEFAULT 4000,
+                timeout INTEGER DEFAULT 60,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                FOREIGN KEY (batch_id) REFERENCES batches(id) ON DELETE CASCADE
+            )
+        ''')
+        c.execute('INSERT INTO prompts SELECT * FROM prompts_old')
+        c.execute('DROP TABLE prompts_old')
+        conn.commit()
+
     conn.close()
@@ -131,7 +131,7 @@ class EncryptionKeyManager:
         return output_path
 
 
-def get_encrypted_connection(db_path='analysis_batches.db'):
+def get_encrypted_connection(db_path='analysis_batches.db', check_same_thread=True):
     """
     Get SQLCipher encrypted database connection
 
@@ -141,6 +141,8 @@ def get_encrypted_connection(db_path='analysis_batches.db'):
 
     Args:
         db_path: Path to database file
+        check_same_thread: Passed to connect(); the connection pool sets this
+            to False because pooled connections move between request threads
 
     Returns:
         Connection: SQLCipher database connection
@@ -175,7 +177,7 @@ def get_encrypted_connection(db_path='analysis_batches.db'):
     encryption_key = key_manager.get_or_create_db_key()
 
     # Connect to encrypted database
-    conn = sqlcipher.connect(db_path)
+    conn = sqlcipher.connect(db_path, check_same_thread=check_same_thread)
 
     # Set encryption key using PRAGMA
     conn.execute(f"PRAGMA key = '{encryption_key}'")
@@ -7,10 +7,118 @@ Migrates existing SQLite database to SQLCipher encrypted database
 import sqlite3
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from database.encryption import get_encrypted_connection, verify_encryption, EncryptionKeyManager
 
 
+MIGRATION_WORKERS = 4
+
+# Cache of '?,?,...' placeholder strings keyed on column count, so wide
+# tables don't rebuild the same string (and its intermediate list) per table
+_PLACEHOLDERS_CACHE = {}
+
+
+def _placeholders(column_count):
+    """Get a cached '?,?,...' placeholder string for the given column count"""
+    cached = _PLACEHOLDERS_CACHE.get(column_count)
+    if cached is None:
+        cached = _PLACEHOLDERS_CACHE[column_count] = ','.join(['?'] * column_count)
+    return cached
+
+
+def _apply_bulk_ingest_pragmas(conn):
+    """Disable page wiping and durability guarantees on a throwaway migration target"""
+    conn.execute("PRAGMA cipher_memory_security = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("PRAGMA synchronous = OFF")
+
+
+def _dump_tables_worker(source_db, worker_db, tables):
+    """Copy a subset of tables into a per-worker encrypted database
+
+    Each worker owns its connections, so page encryption for the worker DBs
+    runs in parallel instead of funneling through one encryption stream.
+    """
+    source_conn = sqlite3.connect(source_db)
+    source_cursor = source_conn.cursor()
+
+    worker_conn = get_encrypted_connection(worker_db)
+    _apply_bulk_ingest_pragmas(worker_conn)
+    worker_cursor = worker_conn.cursor()
+
+    row_counts = {}
+    for table in tables:
+        source_cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,))
+        schema = source_cursor.fetchone()[0]
+        worker_cursor.execute(schema)
+
+        source_cursor.execute(f"SELECT * FROM {table}")
+        rows = source_cursor.fetchall()
+        if rows:
+            worker_cursor.executemany(
+                f"INSERT INTO {table} VALUES ({_placeholders(len(rows[0]))})", rows)
+        row_counts[table] = len(rows)
+
+    worker_conn.commit()
+    worker_conn.close()
+    source_conn.close()
+    return row_counts
+
+
+def _migrate_tables_parallel(source_db, temp_db, tables, encryption_key):
+    """Migrate tables through parallel worker DBs, then ATTACH+INSERT SELECT merge"""
+    workers = min(MIGRATION_WORKERS, len(tables))
+
+    # Round-robin table assignment across workers
+    assignments = [tables[i::workers] for i in range(workers)]
+    worker_dbs = [f"{temp_db}.worker{i}" for i in range(workers)]
+    for worker_db in worker_dbs:
+        if os.path.exists(worker_db):
+            os.remove(worker_db)
+
+    print(f"[MIGRATION] Migrating {len(tables)} tables with {workers} workers...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_dump_tables_worker, source_db, worker_db, assigned)
+            for worker_db, assigned in zip(worker_dbs, assignments)
+        ]
+        for future in futures:
+            for table, count in future.result().items():
+                print(f"[MIGRATION] Table '{table}': {count} rows")
+
+    # Merge worker DBs into the final target
+    print("[MIGRATION] Merging worker databases...")
+    target_conn = get_encrypted_connection(temp_db)
+    _apply_bulk_ingest_pragmas(target_conn)
+    target_cursor = target_conn.cursor()
+
+    source_conn = sqlite3.connect(source_db)
+    source_cursor = source_conn.cursor()
+
+    try:
+        for i, (worker_db, assigned) in enumerate(zip(worker_dbs, assignments)):
+            alias = f"worker{i}"
+            target_cursor.execute(
+                f"ATTACH DATABASE ? AS {alias} KEY ?", (worker_db, encryption_key))
+            for table in assigned:
+                source_cursor.execute(
+                    "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,))
+                target_cursor.execute(source_cursor.fetchone()[0])
+                target_cursor.execute(
+                    f"INSERT INTO {table} SELECT * FROM {alias}.{table}")
+            target_conn.commit()
+            target_cursor.execute(f"DETACH DATABASE {alias}")
+    finally:
+        source_conn.close()
+        target_conn.commit()
+        target_conn.close()
+        for worker_db in worker_dbs:
+            if os.path.exists(worker_db):
+                os.remove(worker_db)
+
+
 def migrate_database(source_db='analysis_batches.db', backup=True):
     """
     Migrate unencrypted database to encrypted SQLCipher database
@@ -46,44 +154,18 @@ def migrate_database(source_db='analysis_batches.db', backup=True):
         print(f"[BACKUP] Backup created successfully")
         print()
 
-    # Get table schemas and data from source database
+    # Open source database for SQL dump streaming
     print("[MIGRATION] Reading source database...")
     source_conn = sqlite3.connect(source_db)
     source_cursor = source_conn.cursor()
 
-    # Get all tables
+    # Get all tables (for reporting)
     source_cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
     tables = [row[0] for row in source_cursor.fetchall()]
 
     print(f"[MIGRATION] Found {len(tables)} tables: {', '.join(tables)}")
     print()
 
-    # Store schemas and data
-    table_data = {}
-    for table in tables:
-        # Get table schema
-        source_cursor.execute(f"SELECT sql FROM sqlite_master WHERE type='table' AND name='{table}'")
-        schema = source_cursor.fetchone()[0]
-
-        # Get table data
-        source_cursor.execute(f"SELECT * FROM {table}")
-        rows = source_cursor.fetchall()
-
-        # Get column names
-        source_cursor.execute(f"PRAGMA table_info({table})")
-        columns = [row[1] for row in source_cursor.fetchall()]
-
-        table_data[table] = {
-            'schema': schema,
-            'columns': columns,
-            'rows': rows
-        }
-
-        print(f"[MIGRATION] Table '{table}': {len(rows)} rows")
-
-    source_conn.close()
-    print()
-
     # Create temporary encrypted database
     temp_db = f"{source_db}.encrypted.tmp"
     if os.path.exists(temp_db):
@@ -97,27 +179,42 @@ def migrate_database(source_db='analysis_batches.db', backup=True):
     print(f"[SECURITY] Using encryption key from: {key_manager.key_file}")
     print()
 
-    # Create encrypted database
-    encrypted_conn = get_encrypted_connection(temp_db)
-    encrypted_cursor = encrypted_conn.cursor()
-
-    # Create tables and insert data
-    for table, data in table_data.items():
-        print(f"[MIGRATION] Migrating table '{table}'...")
-
-        # Create table
-        encrypted_cursor.execute(data['schema'])
-
-        # Insert data
-        if data['rows']:
-            placeholders = ','.join(['?'] * len(data['columns']))
-            insert_sql = f"INSERT INTO {table} VALUES ({placeholders})"
-            encrypted_cursor.executemany(insert_sql, data['rows'])
-
-        print(f"[MIGRATION] Migrated {len(data['rows'])} rows")
-
-    encrypted_conn.commit()
-    encrypted_conn.close()
+    if len(tables) > 1:
+        # Independent tables: fan out across worker threads, each encrypting
+        # its own temp DB, then merge with ATTACH + INSERT SELECT
+        source_conn.close()
+        _migrate_tables_parallel(source_db, temp_db, tables, encryption_key)
+    else:
+        # Single table (or empty DB): replay the SQL dump from iterdump()
+        # instead of materializing every row as a Python tuple. The dump is
+        # applied in large executescript() chunks so statement parsing and
+        # row insertion stay inside SQLite's C code.
+        encrypted_conn = get_encrypted_connection(temp_db)
+        _apply_bulk_ingest_pragmas(encrypted_conn)
+        encrypted_cursor = encrypted_conn.cursor()
+
+        print("[MIGRATION] Replaying SQL dump into encrypted database...")
+        statement_count = 0
+        script_chunk = []
+        for statement in source_conn.iterdump():
+            # iterdump emits its own BEGIN/COMMIT; executescript manages
+            # transactions per chunk, so skip them
+            if statement in ('BEGIN TRANSACTION;', 'COMMIT;'):
+                continue
+            script_chunk.append(statement)
+            statement_count += 1
+            if len(script_chunk) >= 10000:
+                encrypted_cursor.executescript('\n'.join(script_chunk))
+                script_chunk = []
+
+        if script_chunk:
+            encrypted_cursor.executescript('\n'.join(script_chunk))
+
+        print(f"[MIGRATION] Replayed {statement_count} SQL statements")
+
+        source_conn.close()
+        encrypted_conn.commit()
+        encrypted_conn.close()
     print()
 
     # Verify encryption
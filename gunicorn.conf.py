@@ -0,0 +1,32 @@
+"""
+Production WSGI configuration: gunicorn with gevent workers
+
+Every route in this app is I/O-bound on Salesforce or the LLM backend, so
+gevent's cooperative sockets let each worker serve many requests while
+others are blocked on HTTP. The gevent worker class monkey-patches the
+standard library before the app (and requests) is imported, so no route
+changes are needed.
+
+Run with: gunicorn -c gunicorn.conf.py app:app
+"""
+import os
+
+# Match app.py: localhost only — access control depends on it
+bind = f"127.0.0.1:{os.environ.get('PORT', '4000')}"
+
+worker_class = 'gevent'
+workers = int(os.environ.get('WEB_CONCURRENCY', '4'))
+worker_connections = 1000
+
+# Batch endpoints can legitimately run for minutes against a local LLM
+timeout = 600
+graceful_timeout = 30
+keepalive = 5
+
+# Reuse the same self-signed certificate the dev server uses
+if os.environ.get('USE_HTTPS', 'True').lower() == 'true':
+    _cert = 'ssl/localhost.crt'
+    _key = 'ssl/localhost.key'
+    if os.path.exists(_cert) and os.path.exists(_key):
+        certfile = _cert
+        keyfile = _key
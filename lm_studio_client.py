@@ -4,17 +4,90 @@ Supports LM Studio (local/remote), OpenAI ChatGPT, and Microsoft Copilot APIs
 """
 
 import os
+import socket
 import requests
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Environment defaults resolved once at import instead of per client instance
+_DEFAULT_PROVIDER = os.getenv('LLM_PROVIDER', 'lmstudio')  # lmstudio, openai, copilot
+_DEFAULT_ENDPOINT = os.getenv('LM_STUDIO_ENDPOINT', 'http://localhost:1234')
+_DEFAULT_API_KEY = os.getenv('OPENAI_API_KEY') or os.getenv('COPILOT_API_KEY')
+_DEFAULT_MODEL = os.getenv('LLM_MODEL', 'gpt-3.5-turbo')
+_DEFAULT_TEMPERATURE = float(os.getenv('LLM_TEMPERATURE', '0.7'))
+_DEFAULT_MAX_TOKENS = int(os.getenv('LLM_MAX_TOKENS', '4000'))
+
+
+# Per-provider request configuration driving the shared _post_chat() path.
+# 'url' resolves the endpoint from the client instance, 'auth' marks providers
+# that require an API key, and 'timeout' matches the original per-provider values.
+PROVIDERS = {
+    'lmstudio': {
+        'label': 'LM Studio',
+        'url': lambda client: f"{client.endpoint}/v1/chat/completions",
+        'auth': False,
+        'timeout': 600
+    },
+    'openai': {
+        'label': 'OpenAI',
+        'url': lambda client: "https://api.openai.com/v1/chat/completions",
+        'auth': True,
+        'timeout': 60
+    },
+    'copilot': {
+        'label': 'Copilot',
+        'url': lambda client: os.getenv('COPILOT_ENDPOINT', 'https://api.openai.com/v1/chat/completions'),
+        'auth': True,
+        'timeout': 60
+    }
+}
+
+
+class _TunedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter with larger read buffers and TCP_NODELAY for big completions
+
+    64KB read blocks cut syscall count when pulling multi-KB JSON bodies, and
+    TCP_NODELAY avoids Nagle delays on the small request payloads we send.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['blocksize'] = 65536
+        kwargs['socket_options'] = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+        super().init_poolmanager(*args, **kwargs)
+
 
 class LMStudioClient:
     def __init__(self):
-        self.provider = os.getenv('LLM_PROVIDER', 'lmstudio')  # lmstudio, openai, copilot
-        self.endpoint = os.getenv('LM_STUDIO_ENDPOINT', 'http://localhost:1234')
-        self.api_key = os.getenv('OPENAI_API_KEY') or os.getenv('COPILOT_API_KEY')
-        self.model = os.getenv('LLM_MODEL', 'gpt-3.5-turbo')
-        self.temperature = float(os.getenv('LLM_TEMPERATURE', '0.7'))
-        self.max_tokens = int(os.getenv('LLM_MAX_TOKENS', '4000'))
+        self.provider = _DEFAULT_PROVIDER
+        self.endpoint = _DEFAULT_ENDPOINT
+        self.api_key = _DEFAULT_API_KEY
+        self.model = _DEFAULT_MODEL
+        self.temperature = _DEFAULT_TEMPERATURE
+        self.max_tokens = _DEFAULT_MAX_TOKENS
+        # Auth headers built once per api_key change instead of per request
+        self._auth_headers = self._build_auth_headers()
+        # Shared session so streaming and repeated calls reuse connections.
+        # Retry transient provider errors (429/5xx and network blips) with
+        # exponential backoff instead of failing the whole batch after one stall.
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['POST'],
+            respect_retry_after_header=True
+        )
+        self._session = requests.Session()
+        adapter = _TunedHTTPAdapter(max_retries=retry)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
 
     def get_config(self) -> Dict:
         """Get current configuration"""
@@ -35,6 +108,7 @@ class LMStudioClient:
             self.endpoint = config['endpoint']
         if 'api_key' in config:
             self.api_key = config['api_key']
+            self._auth_headers = self._build_auth_headers()
         if 'model' in config:
             self.model = config['model']
         if 'temperature' in config:
@@ -42,80 +116,44 @@ class LMStudioClient:
         if 'max_tokens' in config:
             self.max_tokens = int(config['max_tokens'])
 
-    def generate(self, prompt: str) -> str:
-        """Generate completion using configured provider"""
-        provider = self.provider.replace('_', '')  # Handle both lm_studio and lmstudio
-
-        # HIPAA Compliance: Block OpenAI - no BAA in place
-        if provider == 'openai':
-            raise Exception("OpenAI provider is disabled: No Business Associate Agreement (BAA) in place. Use LM Studio or Microsoft Copilot only.")
-
-        if provider in ['lmstudio']:
-            return self._generate_lmstudio(prompt)
-        elif provider == 'copilot':
-            return self._generate_copilot(prompt)
-        else:
-            raise Exception(f"Unknown provider: {self.provider}")
-
-    def generate_chat(self, messages: list, temperature: Optional[float] = None, max_tokens: Optional[int] = None) -> str:
-        """Generate completion using chat-style messages"""
-        temp = temperature if temperature is not None else self.temperature
-        tokens = max_tokens if max_tokens is not None else self.max_tokens
+    def _build_auth_headers(self) -> Optional[Dict[str, str]]:
+        """Build the Bearer-auth headers dict for providers that need it"""
+        if not self.api_key:
+            return None
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
 
+    def _resolve_provider(self) -> str:
+        """Resolve the configured provider name to a PROVIDERS key"""
         provider = self.provider.replace('_', '')  # Handle both lm_studio and lmstudio
 
         # HIPAA Compliance: Block OpenAI - no BAA in place
         if provider == 'openai':
             raise Exception("OpenAI provider is disabled: No Business Associate Agreement (BAA) in place. Use LM Studio or Microsoft Copilot only.")
 
-        if provider in ['lmstudio']:
-            return self._generate_lmstudio_chat(messages, temp, tokens)
-        elif provider == 'copilot':
-            return self._generate_copilot_chat(messages, temp, tokens)
-        else:
+        if provider not in PROVIDERS:
             raise Exception(f"Unknown provider: {self.provider}")
 
-    def _generate_lmstudio(self, prompt: str) -> str:
-        """Generate using LM Studio (local or remote)"""
-        url = f"{self.endpoint}/v1/completions"
-
-        payload = {
-            "prompt": prompt,
-            "temperature": self.temperature,
-            "max_tokens": self.max_tokens,
-            "stop": []  # Remove stop sequences to allow longer responses
-        }
-
-        try:
-            response = requests.post(url, json=payload, timeout=600)
-            response.raise_for_status()
-            data = response.json()
-
-            # LM Studio returns completions in choices array
-            if 'choices' in data and len(data['choices']) > 0:
-                return data['choices'][0]['text'].strip()
-            else:
-                raise Exception("No completion returned from LM Studio")
-
-        except requests.exceptions.ConnectionError:
-            raise Exception(f"Could not connect to LM Studio at {self.endpoint}. Is it running?")
-        except Exception as e:
-            raise Exception(f"LM Studio generation failed: {str(e)}")
-
-    def _generate_openai(self, prompt: str) -> str:
-        """Generate using OpenAI ChatGPT API"""
-        if not self.api_key:
-            raise Exception("OpenAI API key not configured")
-
-        url = "https://api.openai.com/v1/chat/completions"
+        return provider
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+    def generate(self, prompt: str) -> str:
+        """Generate completion using configured provider"""
+        provider = self._resolve_provider()
+
+        if provider == 'lmstudio':
+            # LM Studio uses the raw completions endpoint: the prompt goes to
+            # the model verbatim with no chat template applied, and the empty
+            # stop list allows long responses
+            return self._post_lmstudio_completion({
+                "prompt": prompt,
+                "temperature": self.temperature,
+                "max_tokens": self.max_tokens,
+                "stop": []  # Remove stop sequences to allow longer responses
+            })
 
         payload = {
-            "model": self.model,
             "messages": [
                 {"role": "user", "content": prompt}
             ],
@@ -123,87 +161,89 @@ class LMStudioClient:
             "max_tokens": self.max_tokens
         }
 
-        try:
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            response.raise_for_status()
-            data = response.json()
+        return self._post_chat(provider, payload)
+
+    def batch_generate(self, prompts: List[str], batch_size: int = 8,
+                       dedupe: bool = True) -> List[Union[str, Exception]]:
+        """Generate completions for many prompts, preserving input order
+
+        The chat-completions endpoints accept one prompt per request, so
+        batching is expressed as up to batch_size concurrent requests over
+        the pooled session; the LLM server is then free to batch them into
+        shared forward passes. Prompts are dispatched in length-homogeneous
+        bins: generation time tracks prompt/completion length, so sorting by
+        estimated token count (len/4) before chunking keeps each bin from
+        stalling on one much longer straggler. A failed prompt yields its
+        Exception in the result list instead of aborting the whole batch,
+        so callers can do per-record error accounting.
+
+        With dedupe (the default), byte-identical prompts are generated once
+        and the completion shared across their positions — records with equal
+        field slices stop paying redundant LLM calls. Pass dedupe=False when
+        repeated prompts should each produce an independent sample.
+        """
+        if not prompts:
+            return []
+
+        if dedupe:
+            unique_index = {}
+            for prompt in prompts:
+                if prompt not in unique_index:
+                    unique_index[prompt] = len(unique_index)
+            if len(unique_index) < len(prompts):
+                unique_results = self.batch_generate(list(unique_index),
+                                                     batch_size=batch_size, dedupe=False)
+                return [unique_results[unique_index[prompt]] for prompt in prompts]
+
+        # Validate provider/config once up front instead of per prompt
+        self._resolve_provider()
+
+        def _one(prompt):
+            try:
+                return self.generate(prompt)
+            except Exception as e:
+                return e
+
+        order = sorted(range(len(prompts)), key=lambda i: len(prompts[i]))
+        results = [None] * len(prompts)
+
+        with ThreadPoolExecutor(max_workers=min(batch_size, len(prompts))) as executor:
+            for start in range(0, len(order), batch_size):
+                bin_indices = order[start:start + batch_size]
+                bin_results = executor.map(_one, [prompts[i] for i in bin_indices])
+                for index, result in zip(bin_indices, bin_results):
+                    results[index] = result
+
+        return results
 
-            if 'choices' in data and len(data['choices']) > 0:
-                return data['choices'][0]['message']['content'].strip()
-            else:
-                raise Exception("No completion returned from OpenAI")
-
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 401:
-                raise Exception("Invalid OpenAI API key")
-            elif e.response.status_code == 429:
-                raise Exception("OpenAI rate limit exceeded")
-            else:
-                raise Exception(f"OpenAI API error: {e.response.text}")
-        except Exception as e:
-            raise Exception(f"OpenAI generation failed: {str(e)}")
-
-    def _generate_copilot(self, prompt: str) -> str:
-        """Generate using Microsoft Copilot API (OpenAI-compatible endpoint)"""
-        if not self.api_key:
-            raise Exception("Copilot API key not configured")
-
-        # Microsoft Copilot uses OpenAI-compatible API
-        # Endpoint might be different, e.g., Azure OpenAI endpoint
-        copilot_endpoint = os.getenv('COPILOT_ENDPOINT', 'https://api.openai.com/v1/chat/completions')
-
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+    def generate_chat(self, messages: list, temperature: Optional[float] = None, max_tokens: Optional[int] = None) -> str:
+        """Generate completion using chat-style messages"""
+        provider = self._resolve_provider()
 
         payload = {
-            "model": self.model,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": self.temperature,
-            "max_tokens": self.max_tokens
+            "messages": messages,
+            "temperature": temperature if temperature is not None else self.temperature,
+            "max_tokens": max_tokens if max_tokens is not None else self.max_tokens
         }
 
-        try:
-            response = requests.post(copilot_endpoint, headers=headers, json=payload, timeout=60)
-            response.raise_for_status()
-            data = response.json()
+        if provider == 'lmstudio':
+            payload["response_format"] = {"type": "json_object"}  # Force JSON output
 
-            if 'choices' in data and len(data['choices']) > 0:
-                return data['choices'][0]['message']['content'].strip()
-            else:
-                raise Exception("No completion returned from Copilot")
+        return self._post_chat(provider, payload)
 
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 401:
-                raise Exception("Invalid Copilot API key")
-            elif e.response.status_code == 429:
-                raise Exception("Copilot rate limit exceeded")
-            else:
-                raise Exception(f"Copilot API error: {e.response.text}")
-        except Exception as e:
-            raise Exception(f"Copilot generation failed: {str(e)}")
-
-    def _generate_lmstudio_chat(self, messages: list, temperature: float, max_tokens: int) -> str:
-        """Generate using LM Studio with chat messages"""
-        url = f"{self.endpoint}/v1/chat/completions"
-
-        payload = {
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "response_format": {"type": "json_object"}  # Force JSON output
-        }
+    def _post_lmstudio_completion(self, payload: Dict) -> str:
+        """POST a raw completions payload to LM Studio and extract the text"""
+        url = f"{self.endpoint}/v1/completions"
 
         try:
-            response = requests.post(url, json=payload, timeout=600)
+            response = self._session.post(url, json=payload,
+                                          timeout=(5, PROVIDERS['lmstudio']['timeout']))
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content) if orjson else response.json()
 
+            # LM Studio returns completions in choices array
             if 'choices' in data and len(data['choices']) > 0:
-                return data['choices'][0]['message']['content'].strip()
+                return data['choices'][0]['text'].strip()
             else:
                 raise Exception("No completion returned from LM Studio")
 
@@ -212,83 +252,42 @@ class LMStudioClient:
         except Exception as e:
             raise Exception(f"LM Studio generation failed: {str(e)}")
 
-    def _generate_openai_chat(self, messages: list, temperature: float, max_tokens: int) -> str:
-        """Generate using OpenAI ChatGPT API with chat messages"""
-        if not self.api_key:
-            raise Exception("OpenAI API key not configured")
+    def _post_chat(self, provider: str, payload: Dict) -> str:
+        """POST a chat-completions payload to the provider and extract the content"""
+        config = PROVIDERS[provider]
+        label = config['label']
 
-        url = "https://api.openai.com/v1/chat/completions"
+        headers = None
+        if config['auth']:
+            if not self._auth_headers:
+                raise Exception(f"{label} API key not configured")
+            headers = self._auth_headers
+            payload["model"] = self.model
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "model": self.model,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens
-        }
-
-        try:
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            response.raise_for_status()
-            data = response.json()
-
-            if 'choices' in data and len(data['choices']) > 0:
-                return data['choices'][0]['message']['content'].strip()
-            else:
-                raise Exception("No completion returned from OpenAI")
-
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 401:
-                raise Exception("Invalid OpenAI API key")
-            elif e.response.status_code == 429:
-                raise Exception("OpenAI rate limit exceeded")
-            else:
-                raise Exception(f"OpenAI API error: {e.response.text}")
-        except Exception as e:
-            raise Exception(f"OpenAI generation failed: {str(e)}")
-
-    def _generate_copilot_chat(self, messages: list, temperature: float, max_tokens: int) -> str:
-        """Generate using Microsoft Copilot API with chat messages"""
-        if not self.api_key:
-            raise Exception("Copilot API key not configured")
-
-        copilot_endpoint = os.getenv('COPILOT_ENDPOINT', 'https://api.openai.com/v1/chat/completions')
-
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "model": self.model,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens
-        }
+        url = config['url'](self)
 
         try:
-            response = requests.post(copilot_endpoint, headers=headers, json=payload, timeout=60)
+            response = self._session.post(url, headers=headers, json=payload, timeout=(5, config['timeout']))
             response.raise_for_status()
-            data = response.json()
+            # orjson is ~3-5x faster than stdlib json on typical completion payloads
+            data = orjson.loads(response.content) if orjson else response.json()
 
             if 'choices' in data and len(data['choices']) > 0:
                 return data['choices'][0]['message']['content'].strip()
             else:
-                raise Exception("No completion returned from Copilot")
+                raise Exception(f"No completion returned from {label}")
 
+        except requests.exceptions.ConnectionError:
+            raise Exception(f"Could not connect to {label} at {url}. Is it running?")
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 401:
-                raise Exception("Invalid Copilot API key")
+                raise Exception(f"Invalid {label} API key")
             elif e.response.status_code == 429:
-                raise Exception("Copilot rate limit exceeded")
+                raise Exception(f"{label} rate limit exceeded")
             else:
-                raise Exception(f"Copilot API error: {e.response.text}")
+                raise Exception(f"{label} API error: {e.response.text}")
         except Exception as e:
-            raise Exception(f"Copilot generation failed: {str(e)}")
+            raise Exception(f"{label} generation failed: {str(e)}")
 
     def test_connection(self) -> Dict:
         """Test connection to the configured provider"""
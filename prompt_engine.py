@@ -6,6 +6,35 @@ Handles variable substitution in prompt templates
 import re
 from typing import Dict, List
 
+
+class CompiledTemplate:
+    """A prompt template pre-split into literal and variable segments
+
+    Compiling pays the regex scan once; render() is then a plain list build
+    and ''.join per record, which matters when a batch runs the same
+    template over thousands of records.
+    """
+
+    def __init__(self, segments: List, variables: List[str]):
+        # segments: (is_variable, text) tuples in template order
+        self._segments = segments
+        self.variables = variables
+
+    def render(self, record: Dict) -> str:
+        """Render the template against a record (same semantics as build_prompt)"""
+        parts = []
+        for is_variable, text in self._segments:
+            if is_variable:
+                value = record.get(text)
+                if value is None or value == '':
+                    parts.append(f"[{text}: not provided]")
+                else:
+                    parts.append(str(value))
+            else:
+                parts.append(text)
+        return ''.join(parts)
+
+
 class PromptEngine:
     def __init__(self):
         # Pattern to match {{Field_Name__c}} placeholders
@@ -40,6 +69,33 @@ class PromptEngine:
 
         return completed_prompt
 
+    def compile(self, template: str) -> CompiledTemplate:
+        """
+        Compile a template into literal/variable segments for repeated rendering
+
+        Args:
+            template: Prompt template with {{Field_Name__c}} placeholders
+
+        Returns:
+            CompiledTemplate whose render(record) matches build_prompt output
+        """
+        segments = []
+        variables = []
+        pos = 0
+
+        for match in self.variable_pattern.finditer(template):
+            if match.start() > pos:
+                segments.append((False, template[pos:match.start()]))
+            field_name = match.group(1).strip()
+            segments.append((True, field_name))
+            variables.append(field_name)
+            pos = match.end()
+
+        if pos < len(template):
+            segments.append((False, template[pos:]))
+
+        return CompiledTemplate(segments, variables)
+
     def extract_variables(self, template: str) -> List[str]:
         """
         Extract all variable names from a template
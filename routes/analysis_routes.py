@@ -2,13 +2,18 @@
 Analysis routes for batch management, prompt building, execution, and history
 This is the main set of routes for the CRM Analytics Prompt Execution Application
 """
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+import gzip
 import json
+import logging
+import sqlite3
+import zlib
 import uuid
 import threading
 import time
 import io
 import csv
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from database.db import get_connection
 from services.batch_execution_service import batch_executions, run_batch_execution
@@ -17,9 +22,104 @@ from utils.json_utils import extract_json_from_llm_response
 from prompt_engine import PromptEngine
 from audit_logger import get_audit_logger, AuditLogger
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 analysis_bp = Blueprint('analysis', __name__)
 
+# %s-style args so debug lines cost a level check, not string formatting,
+# when the root logger runs at INFO in production
+logger = logging.getLogger(__name__)
+
+# Hot-path SQL hoisted to module level so every request replays the exact
+# same statement text and hits the connection's prepared-statement cache
+SQL_GET_BATCHES = '''
+    SELECT b.*,
+           CASE WHEN p.batch_id IS NOT NULL THEN 1 ELSE 0 END as has_prompt
+    FROM batches b
+    LEFT JOIN prompts p ON b.id = p.batch_id
+    ORDER BY b.created_at DESC
+'''
+
+SQL_INSERT_BATCH = '''
+    INSERT INTO batches (id, name, dataset_id, dataset_name, dataset_config_id, description, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+SQL_UPSERT_PROMPT = '''
+    INSERT INTO prompts
+    (batch_id, prompt_template, response_schema, schema_description,
+     provider, endpoint, temperature, max_tokens, timeout, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(batch_id) DO UPDATE SET
+        prompt_template=excluded.prompt_template,
+        response_schema=excluded.response_schema,
+        schema_description=excluded.schema_description,
+        provider=excluded.provider,
+        endpoint=excluded.endpoint,
+        temperature=excluded.temperature,
+        max_tokens=excluded.max_tokens,
+        timeout=excluded.timeout,
+        updated_at=excluded.updated_at
+'''
+
+SQL_GET_HISTORY = '''
+    SELECT batch_id, batch_name, dataset_name, total_records,
+           success_count, error_count, execution_time, executed_at
+    FROM execution_history
+    ORDER BY executed_at DESC
+'''
+
+SQL_COMBINED_RESULTS = '''
+    SELECT r.record_id, h.batch_name || '_' || r.column_name, r.value
+    FROM execution_results r
+    JOIN execution_history h ON h.batch_id = r.batch_id
+    ORDER BY r.record_id
+'''
+
+SQL_COMBINED_COLUMNS = '''
+    SELECT DISTINCT h.batch_name || '_' || r.column_name
+    FROM execution_results r
+    JOIN execution_history h ON h.batch_id = r.batch_id
+'''
+
+# SAQL queries embed the ID list inline, so very large 'in' filters can blow
+# past query length limits; split them into chunks queried concurrently
+SAQL_ID_CHUNK_SIZE = 500
+
+SQL_PROVING_GROUND_CONFIG = '''
+    SELECT b.id, b.dataset_id,
+           p.prompt_template, p.response_schema, p.provider, p.endpoint,
+           p.temperature, p.max_tokens, p.timeout,
+           dc.record_id_field, dc.saql_filter
+    FROM batches b
+    LEFT JOIN prompts p ON p.batch_id = b.id
+    LEFT JOIN dataset_configs dc ON dc.crm_dataset_id = b.dataset_id
+    WHERE b.id = ?
+'''
+
+def _gzip_stream(chunks):
+    """Gzip-compress a stream of text chunks for a Content-Encoding: gzip response
+
+    Level 1 compresses CSV 5-10x at hundreds of MB/s, so the cost is noise
+    next to the bandwidth saved, and streaming is preserved.
+    """
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 31)  # wbits=31 -> gzip framing
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _json_loads(text):
+    """Parse JSON with orjson when available (several times faster than stdlib)"""
+    return orjson.loads(text) if orjson else json.loads(text)
+
+
 # Mutable container for client getter functions (set by main app)
 _client_funcs = {
     'get_sf_client': None,
@@ -55,16 +155,10 @@ def analysis_batches():
     if request.method == 'GET':
         try:
             conn = get_connection()
-            conn.row_factory = lambda cursor, row: dict(zip([col[0] for col in cursor.description], row))
+            conn.row_factory = sqlite3.Row
             c = conn.cursor()
-            c.execute('''
-                SELECT b.*,
-                       CASE WHEN p.batch_id IS NOT NULL THEN 1 ELSE 0 END as has_prompt
-                FROM batches b
-                LEFT JOIN prompts p ON b.id = p.batch_id
-                ORDER BY b.created_at DESC
-            ''')
-            batches = c.fetchall()
+            c.execute(SQL_GET_BATCHES)
+            batches = [dict(row) for row in c.fetchall()]
             conn.close()
             return jsonify({'success': True, 'batches': batches})
         except Exception as e:
@@ -78,10 +172,7 @@ def analysis_batches():
 
             conn = get_connection()
             c = conn.cursor()
-            c.execute('''
-                INSERT INTO batches (id, name, dataset_id, dataset_name, dataset_config_id, description, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            c.execute(SQL_INSERT_BATCH, (
                 batch_id,
                 data['name'],
                 data['dataset_id'],
@@ -105,14 +196,14 @@ def analysis_batch(batch_id):
     if request.method == 'GET':
         try:
             conn = get_connection()
-            conn.row_factory = lambda cursor, row: dict(zip([col[0] for col in cursor.description], row))
+            conn.row_factory = sqlite3.Row
             c = conn.cursor()
             c.execute('SELECT * FROM batches WHERE id=?', (batch_id,))
             batch = c.fetchone()
             conn.close()
 
             if batch:
-                return jsonify({'success': True, 'batch': batch})
+                return jsonify({'success': True, 'batch': dict(batch)})
             else:
                 return jsonify({'success': False, 'error': 'Batch not found'}), 404
         except Exception as e:
@@ -122,7 +213,7 @@ def analysis_batch(batch_id):
         try:
             conn = get_connection()
             c = conn.cursor()
-            c.execute('DELETE FROM prompts WHERE batch_id=?', (batch_id,))
+            # Prompts, status, results and history cascade via FK
             c.execute('DELETE FROM batches WHERE id=?', (batch_id,))
             conn.commit()
             conn.close()
@@ -137,7 +228,7 @@ def get_batch_fields(batch_id):
     """Get fields for a specific batch (filtered by dataset configuration)"""
     try:
         conn = get_connection()
-        conn.row_factory = lambda cursor, row: dict(zip([col[0] for col in cursor.description], row))
+        conn.row_factory = sqlite3.Row
         c = conn.cursor()
 
         # Get batch info
@@ -160,8 +251,8 @@ def get_batch_fields(batch_id):
             config = c.fetchone()
 
             if config:
-                selected_field_names = json.loads(config['selected_fields'])
-                # Filter to only selected fields
+                selected_field_names = set(_json_loads(config['selected_fields']))
+                # Filter to only selected fields (set gives O(1) membership)
                 filtered_fields = [f for f in all_fields if f['name'] in selected_field_names]
                 conn.close()
                 return jsonify({'success': True, 'fields': filtered_fields})
@@ -185,49 +276,20 @@ def save_prompt():
         conn = get_connection()
         c = conn.cursor()
 
-        # Check if prompt exists
-        c.execute('SELECT batch_id FROM prompts WHERE batch_id=?', (batch_id,))
-        existing = c.fetchone()
-
-        if existing:
-            # Update existing prompt
-            c.execute('''
-                UPDATE prompts
-                SET prompt_template=?, response_schema=?, schema_description=?,
-                    provider=?, endpoint=?, temperature=?, max_tokens=?, timeout=?, updated_at=?
-                WHERE batch_id=?
-            ''', (
-                data.get('prompt_template', ''),
-                data.get('response_schema', ''),
-                data.get('schema_description', ''),
-                data.get('provider', 'lm_studio'),
-                data.get('endpoint', ''),
-                data.get('temperature', 0.7),
-                data.get('max_tokens', 4000),
-                data.get('timeout', 60),
-                now,
-                batch_id
-            ))
-        else:
-            # Insert new prompt
-            c.execute('''
-                INSERT INTO prompts
-                (batch_id, prompt_template, response_schema, schema_description,
-                 provider, endpoint, temperature, max_tokens, timeout, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                batch_id,
-                data.get('prompt_template', ''),
-                data.get('response_schema', ''),
-                data.get('schema_description', ''),
-                data.get('provider', 'lm_studio'),
-                data.get('endpoint', ''),
-                data.get('temperature', 0.7),
-                data.get('max_tokens', 4000),
-                data.get('timeout', 60),
-                now,
-                now
-            ))
+        # Single atomic UPSERT instead of check-then-insert-or-update
+        c.execute(SQL_UPSERT_PROMPT, (
+            batch_id,
+            data.get('prompt_template', ''),
+            data.get('response_schema', ''),
+            data.get('schema_description', ''),
+            data.get('provider', 'lm_studio'),
+            data.get('endpoint', ''),
+            data.get('temperature', 0.7),
+            data.get('max_tokens', 4000),
+            data.get('timeout', 60),
+            now,
+            now
+        ))
 
         conn.commit()
         conn.close()
@@ -242,13 +304,14 @@ def get_prompt(batch_id):
     """Get prompt configuration for a batch"""
     try:
         conn = get_connection()
-        conn.row_factory = lambda cursor, row: dict(zip([col[0] for col in cursor.description], row))
+        conn.row_factory = sqlite3.Row
         c = conn.cursor()
         c.execute('SELECT * FROM prompts WHERE batch_id=?', (batch_id,))
         prompt = c.fetchone()
         conn.close()
 
         if prompt:
+            prompt = dict(prompt)
             return jsonify({'success': True, 'prompt': prompt, 'config': prompt})  # Return both for compatibility
         else:
             return jsonify({'success': False, 'error': 'Prompt configuration not found'}), 404
@@ -301,22 +364,24 @@ def preview_prompt_execute():
         # Load global LLM settings
         global_settings = load_settings_func()
 
-        # Get batch info
+        # Fetch batch and dataset config together and fail fast before any
+        # Salesforce or model work happens
         conn = get_connection()
-        conn.row_factory = lambda cursor, row: dict(zip([col[0] for col in cursor.description], row))
+        conn.row_factory = sqlite3.Row
         c = conn.cursor()
-        c.execute('SELECT * FROM batches WHERE id = ?', (batch_id,))
+        c.execute('''
+            SELECT b.dataset_id, dc.record_id_field
+            FROM batches b
+            LEFT JOIN dataset_configs dc ON dc.crm_dataset_id = b.dataset_id
+            WHERE b.id = ?
+        ''', (batch_id,))
         batch = c.fetchone()
-
-        # Get dataset configuration to find record ID field
-        c.execute('SELECT * FROM dataset_configs WHERE crm_dataset_id = ?', (batch['dataset_id'],))
-        dataset_config = c.fetchone()
         conn.close()
 
         if not batch:
             return jsonify({'success': False, 'error': 'Batch not found'}), 404
 
-        if not dataset_config:
+        if batch['record_id_field'] is None:
             return jsonify({'success': False, 'error': 'Dataset configuration not found'}), 404
 
         # Get sample record from dataset
@@ -326,16 +391,17 @@ def preview_prompt_execute():
         # Extract all field names from the prompt template
         prompt_engine = PromptEngine()
         prompt_fields = prompt_engine.extract_variables(prompt_template)
-        print(f"Fields referenced in prompt: {prompt_fields}")
+        logger.debug("Fields referenced in prompt: %s", prompt_fields)
 
         # Get all available field names from dataset
         all_field_names = [f['name'] for f in fields_data]
-        print(f"Available fields in dataset: {all_field_names}")
+        available_fields = set(all_field_names)
+        logger.debug("Available fields in dataset: %s", all_field_names)
 
         # Use fields from prompt if they exist, otherwise use all fields (up to 50)
         if prompt_fields:
             # Only query fields that exist in the dataset
-            field_names = [f for f in prompt_fields if f in all_field_names]
+            field_names = [f for f in prompt_fields if f in available_fields]
             if not field_names:
                 # Fallback to first 50 fields if none of the prompt fields exist
                 field_names = all_field_names[:50]
@@ -343,11 +409,11 @@ def preview_prompt_execute():
             field_names = all_field_names[:50]
 
         # Make sure record ID field is included
-        record_id_field = dataset_config['record_id_field']
+        record_id_field = batch['record_id_field']
         if record_id_field not in field_names:
             field_names.append(record_id_field)
 
-        print(f"Querying fields: {field_names}")
+        logger.debug("Querying fields: %s", field_names)
 
         # Query specific record or random sample
         if record_id:
@@ -366,8 +432,7 @@ def preview_prompt_execute():
 
         sample_record = sample_records[0]
 
-        print(f"Sample record structure: {json.dumps(sample_record, indent=2)}")
-        print(f"Sample record keys: {list(sample_record.keys())}")
+        logger.debug("Sample record structure: %s", sample_record)
 
         # Render prompt using prompt engine
         rendered_prompt = prompt_engine.build_prompt(prompt_template, sample_record)
@@ -377,7 +442,7 @@ def preview_prompt_execute():
             # Add JSON schema instructions to the prompt
             rendered_prompt += f"\n\nPlease respond ONLY with valid JSON matching this exact schema:\n{response_schema}\n\nDo not include any explanatory text, only the JSON object."
 
-        print(f"Rendered prompt: {rendered_prompt}")
+        logger.debug("Rendered prompt: %s", rendered_prompt)
 
         # Get LM client and configure with global settings
         lm_client = get_lm_client_func()
@@ -416,64 +481,54 @@ def execute_proving_ground():
         if not record_ids:
             return jsonify({'success': False, 'error': 'Missing record IDs'}), 400
 
-        # Get batch info
+        # Fetch batch, prompt and dataset config in one round trip instead of
+        # three separate queries across two connections
         conn = get_connection()
+        conn.row_factory = sqlite3.Row
         c = conn.cursor()
-        c.execute('SELECT * FROM batches WHERE id = ?', (batch_id,))
-        batch_row = c.fetchone()
+        c.execute(SQL_PROVING_GROUND_CONFIG, (batch_id,))
+        row = c.fetchone()
+        conn.close()
 
-        if not batch_row:
-            conn.close()
+        if not row:
             return jsonify({'success': False, 'error': 'Batch not found'}), 404
 
-        # Parse batch data
-        batch = {
-            'id': batch_row[0],
-            'dataset_id': batch_row[2]
-        }
+        if row['prompt_template'] is None:
+            return jsonify({'success': False, 'error': 'No prompt configuration found for this batch'}), 404
 
-        # Get prompt configuration
-        c.execute('SELECT * FROM prompts WHERE batch_id = ?', (batch_id,))
-        prompt_row = c.fetchone()
-        conn.close()
+        if row['record_id_field'] is None:
+            return jsonify({'success': False, 'error': 'Dataset configuration not found. Please configure the dataset first.'}), 404
 
-        if not prompt_row:
-            return jsonify({'success': False, 'error': 'No prompt configuration found for this batch'}), 404
+        batch = {
+            'id': row['id'],
+            'dataset_id': row['dataset_id']
+        }
 
         prompt_config = {
-            'template': prompt_row[1],
-            'response_schema': prompt_row[2],
-            'provider': prompt_row[4] or 'lm_studio',
-            'endpoint': prompt_row[5],
-            'temperature': prompt_row[6] or 0.7,
-            'max_tokens': prompt_row[7] or 4000,
-            'timeout': prompt_row[8] or 60
+            'template': row['prompt_template'],
+            'response_schema': row['response_schema'],
+            'provider': row['provider'] or 'lm_studio',
+            'endpoint': row['endpoint'],
+            'temperature': row['temperature'] or 0.7,
+            'max_tokens': row['max_tokens'] or 4000,
+            'timeout': row['timeout'] or 60
         }
 
         # Get Salesforce client
         client = get_sf_client_func()
 
-        # Get dataset configuration to find the record ID field
-        conn = get_connection()
-        conn.row_factory = lambda cursor, row: dict(zip([col[0] for col in cursor.description], row))
-        c = conn.cursor()
-        c.execute('SELECT * FROM dataset_configs WHERE crm_dataset_id = ?', (batch['dataset_id'],))
-        dataset_config = c.fetchone()
-        conn.close()
+        record_id_field = row['record_id_field']
+        saql_filter = row['saql_filter'] if row['saql_filter'] else ''  # Get SAQL filter from dataset config
 
-        if not dataset_config:
-            return jsonify({'success': False, 'error': 'Dataset configuration not found. Please configure the dataset first.'}), 404
-
-        record_id_field = dataset_config['record_id_field']
-        saql_filter = dataset_config['saql_filter'] if dataset_config['saql_filter'] else ''  # Get SAQL filter from dataset config
-
-        # Extract fields used in the prompt template
+        # Compile the prompt template once; per-record rendering is then a
+        # plain string build with no regex work
         prompt_engine = PromptEngine()
-        template_fields = prompt_engine.extract_variables(prompt_config['template'])
+        compiled_template = prompt_engine.compile(prompt_config['template'])
+        template_fields = compiled_template.variables
 
         # Get all available fields from dataset to validate
         fields_data = client.get_dataset_fields(batch['dataset_id'])
-        available_field_names = [f['name'] for f in fields_data]
+        available_field_names = {f['name'] for f in fields_data}
 
         # Start with template fields that exist in dataset
         query_fields = [f for f in template_fields if f in available_field_names]
@@ -482,10 +537,10 @@ def execute_proving_ground():
         if record_id_field not in query_fields:
             query_fields.append(record_id_field)
 
-        print(f"Template fields: {template_fields}")
-        print(f"Record ID field: {record_id_field}")
-        print(f"Query fields: {query_fields}")
-        print(f"SAQL filter from config: {saql_filter}")
+        logger.debug("Template fields: %s", template_fields)
+        logger.debug("Record ID field: %s", record_id_field)
+        logger.debug("Query fields: %s", query_fields)
+        logger.debug("SAQL filter from config: %s", saql_filter)
 
         # Filter out empty record IDs (from trailing newlines, etc.)
         record_ids = [rid.strip() for rid in record_ids if rid and rid.strip()]
@@ -496,22 +551,34 @@ def execute_proving_ground():
                 'error': 'No valid record IDs provided after filtering empty values'
             }), 400
 
-        print(f"Querying {len(record_ids)} record IDs: {record_ids[:10]}...")  # Show first 10
+        logger.debug("Querying %d record IDs: %s...", len(record_ids), record_ids[:10])  # Show first 10
 
-        # Query all records at once using 'in' filter (much more efficient than individual queries)
+        # Query records using 'in' filters (much more efficient than individual
+        # queries), chunking large ID lists so no single SAQL statement exceeds
+        # query size limits. Chunks are fetched concurrently.
         # Also apply the dataset's SAQL filter to ensure we only get the configured subset
-        try:
-            filters = {record_id_field: record_ids}  # Pass list for 'in' operator
-            matched_records = client.query_dataset(
+        def query_id_chunk(id_chunk):
+            return client.query_dataset(
                 batch['dataset_id'],
                 query_fields,
-                limit=len(record_ids),
-                filters=filters,
+                limit=len(id_chunk),
+                filters={record_id_field: id_chunk},  # Pass list for 'in' operator
                 saql_filter=saql_filter  # Apply dataset filter
             )
-            print(f"Found {len(matched_records)} matching records")
+
+        try:
+            if len(record_ids) <= SAQL_ID_CHUNK_SIZE:
+                matched_records = query_id_chunk(record_ids)
+            else:
+                id_chunks = [record_ids[i:i + SAQL_ID_CHUNK_SIZE]
+                             for i in range(0, len(record_ids), SAQL_ID_CHUNK_SIZE)]
+                matched_records = []
+                with ThreadPoolExecutor(max_workers=4) as executor:
+                    for chunk_records in executor.map(query_id_chunk, id_chunks):
+                        matched_records.extend(chunk_records)
+            logger.debug("Found %d matching records", len(matched_records))
         except Exception as e:
-            print(f"Error querying records: {str(e)}")
+            logger.error("Error querying records: %s", e)
             return jsonify({
                 'success': False,
                 'error': f'Error querying records: {str(e)}'
@@ -521,9 +588,9 @@ def execute_proving_ground():
         found_ids = {record.get(record_id_field) for record in matched_records}
         not_found = [rid for rid in record_ids if rid not in found_ids]
 
-        print(f"Matched {len(matched_records)} records, {len(not_found)} not found")
+        logger.debug("Matched %d records, %d not found", len(matched_records), len(not_found))
         if not_found:
-            print(f"Not found IDs: {not_found[:10]}")  # Show first 10
+            logger.debug("Not found IDs: %s", not_found[:10])  # Show first 10
 
         if not matched_records:
             return jsonify({
@@ -535,22 +602,20 @@ def execute_proving_ground():
         lm_client = get_lm_client_func()
         global_settings = load_settings_func()
 
-        # Execute prompt on each matched record
-        results = []
-        for record in matched_records:
-            try:
-                # Get record ID
-                record_id = record.get(record_id_field) or 'Unknown'
-
-                # Render prompt with record data
-                rendered_prompt = prompt_engine.build_prompt(prompt_config['template'], record)
+        # Configure once for the whole run; settings are invariant across records
+        lm_client.update_config(global_settings)
 
-                # Append schema instructions if schema is provided
-                if prompt_config['response_schema']:
-                    rendered_prompt += f"\n\nPlease respond ONLY with valid JSON matching this exact schema:\n{prompt_config['response_schema']}\n\nDo not include any explanatory text, only the JSON object."
+        # Schema suffix is the same for every record; build it once
+        schema_suffix = ''
+        if prompt_config['response_schema']:
+            schema_suffix = f"\n\nPlease respond ONLY with valid JSON matching this exact schema:\n{prompt_config['response_schema']}\n\nDo not include any explanatory text, only the JSON object."
 
-                # Execute with model using global settings
-                lm_client.update_config(global_settings)
+        def process_record(record):
+            """Render the prompt for one record, call the model, and parse the response"""
+            record_id = record.get(record_id_field) or 'Unknown'
+            try:
+                # Render prompt with record data
+                rendered_prompt = compiled_template.render(record) + schema_suffix
 
                 model_response = lm_client.generate(rendered_prompt)
 
@@ -558,29 +623,34 @@ def execute_proving_ground():
                 try:
                     # Extract JSON from LLM response (handles special tokens and markdown)
                     clean_response = extract_json_from_llm_response(model_response)
-                    response_json = json.loads(clean_response)
-                except json.JSONDecodeError:
+                    response_json = _json_loads(clean_response)
+                except ValueError:
                     # If not valid JSON, use raw text
                     response_json = {'raw_response': model_response}
 
-                results.append({
+                return {
                     'record_id': record_id,
                     'response': response_json
-                })
+                }
 
             except Exception as record_error:
-                print(f"Error processing record {record_id}: {str(record_error)}")
-                results.append({
+                logger.error("Error processing record %s: %s", record_id, record_error)
+                return {
                     'record_id': record_id,
                     'response': {'error': str(record_error)}
-                })
+                }
+
+        # Execute prompt on each matched record. The per-record work is
+        # I/O-bound HTTP to the model server, so a small thread pool overlaps
+        # the waits; executor.map preserves input order in the results.
+        max_workers = int(global_settings.get('llm_concurrency', 4)) if isinstance(global_settings, dict) else 4
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(process_record, matched_records))
 
         return jsonify({'success': True, 'results': results})
 
     except Exception as e:
-        print(f"Error executing proving ground: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error executing proving ground")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -627,19 +697,19 @@ def execute_batch():
 def get_batch_status(batch_id):
     """Get execution status for a batch (checks both active and persisted)"""
     try:
-        # Check active executions first
-        for exec_id, execution in batch_executions.items():
-            if execution.get('batch_id') == batch_id:
-                return jsonify({
-                    'success': True,
-                    'has_active_execution': True,
-                    'execution_id': exec_id,
-                    'execution': execution
-                })
+        # Check active executions first (O(1) via the batch_id index)
+        execution = batch_executions.find_by_batch(batch_id)
+        if execution is not None:
+            return jsonify({
+                'success': True,
+                'has_active_execution': True,
+                'execution_id': execution['execution_id'],
+                'execution': {k: v for k, v in execution.items() if k != 'csv_gz'}
+            })
 
         # Check persisted status
         conn = get_connection()
-        conn.row_factory = lambda cursor, row: dict(zip([col[0] for col in cursor.description], row))
+        conn.row_factory = sqlite3.Row
         c = conn.cursor()
         c.execute('SELECT * FROM execution_status WHERE batch_id=? ORDER BY updated_at DESC LIMIT 1', (batch_id,))
         status = c.fetchone()
@@ -650,7 +720,7 @@ def get_batch_status(batch_id):
                 'success': True,
                 'has_active_execution': False,
                 'has_persisted_status': True,
-                'status': status
+                'status': dict(status)
             })
 
         return jsonify({
@@ -668,7 +738,8 @@ def get_batch_progress(execution_id):
     """Poll batch execution progress"""
     if execution_id in batch_executions:
         execution = batch_executions[execution_id]
-        return jsonify({'success': True, 'execution': execution})
+        # csv_gz holds raw compressed bytes for the download endpoint
+        return jsonify({'success': True, 'execution': {k: v for k, v in execution.items() if k != 'csv_gz'}})
     else:
         return jsonify({'success': False, 'error': 'Execution not found'}), 404
 
@@ -684,20 +755,29 @@ def download_batch_csv(execution_id):
     if not execution.get('complete'):
         return jsonify({'success': False, 'error': 'Execution not complete'}), 400
 
-    if not execution.get('csv_data'):
+    if not execution.get('csv_gz'):
         return jsonify({'success': False, 'error': 'CSV data not available'}), 404
 
-    # Create file-like object from CSV string
-    csv_data = execution['csv_data']
-    csv_file = io.BytesIO(csv_data.encode('utf-8'))
+    # The CSV for an execution is immutable, so the execution ID doubles as
+    # an ETag: polling UIs re-requesting the file get a 304 with no body.
+    etag = execution_id
+    if etag in request.if_none_match:
+        return Response(status=304)
+
+    # Serve the pre-compressed bytes directly when the client accepts gzip
+    # (browsers decompress transparently); otherwise decompress for it
     filename = execution.get('csv_filename', f'batch_results_{execution_id[:8]}.csv')
+    headers = {
+        'Content-Disposition': f'attachment; filename={filename}',
+        'ETag': etag
+    }
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        body = execution['csv_gz']
+        headers['Content-Encoding'] = 'gzip'
+    else:
+        body = gzip.decompress(execution['csv_gz'])
 
-    return send_file(
-        csv_file,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=filename
-    )
+    return Response(body, mimetype='text/csv', headers=headers)
 
 
 @analysis_bp.route('/api/analysis/history', methods=['GET'])
@@ -705,15 +785,10 @@ def get_execution_history():
     """Get all execution history"""
     try:
         conn = get_connection()
-        conn.row_factory = lambda cursor, row: dict(zip([col[0] for col in cursor.description], row))
+        conn.row_factory = sqlite3.Row
         c = conn.cursor()
-        c.execute('''
-            SELECT batch_id, batch_name, dataset_name, total_records,
-                   success_count, error_count, execution_time, executed_at
-            FROM execution_history
-            ORDER BY executed_at DESC
-        ''')
-        history = c.fetchall()
+        c.execute(SQL_GET_HISTORY)
+        history = [dict(row) for row in c.fetchall()]
         conn.close()
 
         return jsonify({'success': True, 'history': history})
@@ -727,7 +802,12 @@ def download_history_csv(batch_id):
     try:
         conn = get_connection()
         c = conn.cursor()
-        c.execute('SELECT csv_data, batch_name FROM execution_history WHERE batch_id=?', (batch_id,))
+        c.execute('''
+            SELECT hc.csv_data, h.batch_name
+            FROM execution_history_csv hc
+            JOIN execution_history h ON h.batch_id = hc.batch_id
+            WHERE hc.batch_id = ?
+        ''', (batch_id,))
         result = c.fetchone()
         conn.close()
 
@@ -735,14 +815,13 @@ def download_history_csv(batch_id):
             return jsonify({'success': False, 'error': 'Execution history not found'}), 404
 
         csv_data, batch_name = result
-        csv_file = io.BytesIO(csv_data.encode('utf-8'))
         filename = f"{batch_name}_results.csv"
 
-        return send_file(
-            csv_file,
+        # Hand the string straight to Werkzeug; no intermediate BytesIO copy
+        return Response(
+            csv_data,
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
         )
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -753,12 +832,76 @@ def download_combined_csv():
     """Download combined CSV from all batch executions, merging columns by Record ID"""
     try:
         conn = get_connection()
-        conn.row_factory = lambda cursor, row: dict(zip([col[0] for col in cursor.description], row))
+        c = conn.cursor()
+
+        # Merge in SQL from the normalized execution_results table: one query
+        # ordered by record ID, so each output row is assembled in a single
+        # pass inside SQLite instead of re-parsing every CSV blob in Python
+        c.execute(SQL_COMBINED_RESULTS)
+        c.arraysize = 1000
+        chunk = c.fetchmany()
+
+        if chunk:
+            # Gather the full column set up front for the header
+            col_cursor = conn.cursor()
+            col_cursor.execute(SQL_COMBINED_COLUMNS)
+            sorted_columns = ['Record ID'] + sorted(row[0] for row in col_cursor.fetchall())
+            col_index = {name: i for i, name in enumerate(sorted_columns)}
+
+            # Stream one CSV chunk per fetchmany() batch: memory stays
+            # constant regardless of history size and the first bytes reach
+            # the client before the merge finishes
+            def generate_csv(cursor, first_chunk):
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(sorted_columns)
+
+                current_id = None
+                row_values = None
+                chunk = first_chunk
+                try:
+                    while chunk:
+                        for record_id, column, value in chunk:
+                            if record_id != current_id:
+                                if current_id is not None:
+                                    writer.writerow(row_values)
+                                current_id = record_id
+                                row_values = [''] * len(sorted_columns)
+                                row_values[0] = record_id
+                            row_values[col_index[column]] = value
+
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate(0)
+                        chunk = cursor.fetchmany()
+
+                    if current_id is not None:
+                        writer.writerow(row_values)
+                        yield buffer.getvalue()
+                finally:
+                    conn.close()
+
+            body = generate_csv(c, chunk)
+            headers = {'Content-Disposition': 'attachment; filename=all_batches_combined_results.csv'}
+            if 'gzip' in request.headers.get('Accept-Encoding', ''):
+                body = _gzip_stream(body)
+                headers['Content-Encoding'] = 'gzip'
+
+            return Response(
+                stream_with_context(body),
+                mimetype='text/csv',
+                headers=headers
+            )
+
+        # Legacy fallback: history rows written before execution_results
+        # existed only have CSV blobs, so merge those in Python
+        conn.row_factory = sqlite3.Row
         c = conn.cursor()
         c.execute('''
-            SELECT batch_name, dataset_name, csv_data
-            FROM execution_history
-            ORDER BY dataset_name, executed_at DESC
+            SELECT h.batch_name, h.dataset_name, hc.csv_data
+            FROM execution_history h
+            JOIN execution_history_csv hc ON hc.batch_id = h.batch_id
+            ORDER BY h.dataset_name, h.executed_at DESC
         ''')
         rows = c.fetchall()
         conn.close()
@@ -775,53 +918,64 @@ def download_combined_csv():
             batch_name = row['batch_name']
             csv_data = row['csv_data']
 
-            # Parse CSV
-            lines = csv_data.strip().split('\n')
-            if len(lines) < 2:
+            # Parse CSV with plain csv.reader and positional indexing; the
+            # prefixed column names are computed once per batch rather than
+            # rebuilding a dict and re-prefixing strings for every row
+            reader = csv.reader(io.StringIO(csv_data))
+            header = next(reader, None)
+            if not header or 'Record ID' not in header:
                 continue
 
-            reader = csv.DictReader(io.StringIO(csv_data))
+            id_index = header.index('Record ID')
+            prefixed_columns = [None if i == id_index else f"{batch_name}_{col}"
+                                for i, col in enumerate(header)]
+            all_columns.update(col for col in prefixed_columns if col)
 
             for csv_row in reader:
-                record_id = csv_row.get('Record ID', '')
+                if id_index >= len(csv_row):
+                    continue
+                record_id = csv_row[id_index]
                 if not record_id:
                     continue
 
-                # Initialize record if not exists
-                if record_id not in merged_data:
-                    merged_data[record_id] = {'Record ID': record_id}
-
-                # Add all columns from this CSV (prefixed with batch name to avoid conflicts)
-                for col_name, value in csv_row.items():
-                    if col_name == 'Record ID':
-                        continue
-
-                    # Prefix column with batch name for uniqueness
-                    prefixed_col = f"{batch_name}_{col_name}"
-                    all_columns.add(prefixed_col)
-                    merged_data[record_id][prefixed_col] = value
+                record = merged_data.setdefault(record_id, {'Record ID': record_id})
+                for prefixed_col, value in zip(prefixed_columns, csv_row):
+                    if prefixed_col is not None:
+                        record[prefixed_col] = value
 
         # Sort columns for consistent output (Record ID first, then alphabetically)
         sorted_columns = ['Record ID'] + sorted([col for col in all_columns if col != 'Record ID'])
 
-        # Generate combined CSV
-        output = io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=sorted_columns, extrasaction='ignore')
-        writer.writeheader()
-
-        for record_id in sorted(merged_data.keys()):
-            # Fill missing columns with empty strings
-            row_data = {col: merged_data[record_id].get(col, '') for col in sorted_columns}
-            writer.writerow(row_data)
-
-        # Return combined CSV
-        csv_bytes = io.BytesIO(output.getvalue().encode('utf-8'))
-
-        return send_file(
-            csv_bytes,
+        # Stream the merged rows with plain csv.writer and list rows (building
+        # a dict per output row for DictWriter doubles the per-row work),
+        # reusing one small buffer so peak memory stays at a chunk, not the
+        # whole file
+        def generate_legacy_csv():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(sorted_columns)
+
+            for i, record_id in enumerate(sorted(merged_data.keys()), 1):
+                record = merged_data[record_id]
+                # Fill missing columns with empty strings
+                writer.writerow([record.get(col, '') for col in sorted_columns])
+                if i % 1000 == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate(0)
+
+            yield buffer.getvalue()
+
+        body = generate_legacy_csv()
+        headers = {'Content-Disposition': 'attachment; filename="all_batches_combined_results.csv"'}
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            body = _gzip_stream(body)
+            headers['Content-Encoding'] = 'gzip'
+
+        return Response(
+            stream_with_context(body),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'all_batches_combined_results.csv'
+            headers=headers
         )
     except Exception as e:
         import traceback
@@ -2,27 +2,109 @@
 Dataset and dataset configuration routes
 Handles CRM Analytics datasets and user-defined dataset configurations
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, g
 import json
+import sqlite3
+import time
 import uuid
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from database.db import get_connection
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 dataset_bp = Blueprint('dataset', __name__)
 
+# currentVersionId rarely changes, so cache it briefly per dataset; a hit
+# saves one Wave API round-trip on every filter test / distinct-values call
+VERSION_CACHE_TTL = 300  # seconds
+_version_cache = {}  # dataset_id -> (fetched_at, version_id)
+
+# Filter validation verdicts are cached briefly so live-typing UIs that
+# re-submit the same filter don't hit Salesforce for every keystroke
+FILTER_CACHE_TTL = 60  # seconds
+_filter_cache = {}  # (dataset_id, saql_filter) -> (validated_at, response_payload)
+
 # Mutable container for client getter function (set by main app)
 _client_funcs = {
     'get_sf_client': None
 }
 
 
+def _json_loads(text):
+    """Parse JSON with orjson when available (several times faster than stdlib)"""
+    return orjson.loads(text) if orjson else json.loads(text)
+
+
+def _json_dumps(value):
+    """Serialize to a JSON string, preferring orjson"""
+    return orjson.dumps(value).decode() if orjson else json.dumps(value)
+
+
+def _get_dataset_version(client, dataset_id):
+    """Look up a dataset's currentVersionId, cached for a few minutes"""
+    cached = _version_cache.get(dataset_id)
+    if cached and time.time() - cached[0] < VERSION_CACHE_TTL:
+        return cached[1]
+
+    dataset_url = f"{client.instance_url}/services/data/{client.api_version}/wave/datasets/{dataset_id}"
+    dataset_response = client._make_request('GET', dataset_url)
+    dataset_response.raise_for_status()
+    version_id = dataset_response.json().get('currentVersionId')
+
+    if version_id:
+        _version_cache[dataset_id] = (time.time(), version_id)
+    return version_id
+
+
+def _query_distinct_values(client, dataset_id, version_id, field_name, saql_filter):
+    """Run the distinct-values SAQL query for one field"""
+    saql = f'q = load "{dataset_id}/{version_id}";'
+
+    # Apply dataset filter if provided
+    if saql_filter:
+        saql += f'\n{saql_filter}'
+
+    # Group by the field to get distinct values
+    saql += f'\nq = group q by \'{field_name}\';'
+    saql += f'\nq = foreach q generate \'{field_name}\' as value;'
+    saql += '\nq = order q by value asc;'  # Sort alphabetically
+    saql += '\nq = limit q 10000;'  # Limit to prevent too many values
+
+    url = f"{client.instance_url}/services/data/{client.api_version}/wave/query"
+    return client._make_request('POST', url, json={'query': saql})
+
+
+def _extract_distinct_values(result_data):
+    """Unwrap the distinct-value records a Wave query returns
+
+    CRM Analytics returns values as {"value": actual_value}, sometimes
+    double-wrapped. One comprehension pass unwraps, stringifies, and drops
+    null/blank entries without re-running str() per check.
+    """
+    records = result_data.get('results', {}).get('records', [])
+    return [
+        text
+        for record in records
+        if (value := record.get('value')) is not None
+        for unwrapped in [value['value'] if isinstance(value, dict) and 'value' in value else value]
+        if unwrapped is not None and (text := str(unwrapped)).strip()
+    ]
+
+
 def get_sf_client_func():
-    """Get Salesforce client using configured function"""
-    if _client_funcs['get_sf_client'] is None:
-        raise NotImplementedError("SF client getter not configured")
-    return _client_funcs['get_sf_client']()
+    """Get Salesforce client using configured function (cached per request)"""
+    client = getattr(g, 'sf_client', None)
+    if client is None:
+        if _client_funcs['get_sf_client'] is None:
+            raise NotImplementedError("SF client getter not configured")
+        client = g.sf_client = _client_funcs['get_sf_client']()
+    return client
 
 
 @dataset_bp.route('/api/crm-analytics/datasets', methods=['GET'])
@@ -70,8 +152,19 @@ def dataset_configs():
     if request.method == 'GET':
         try:
             conn = get_connection()
-            conn.row_factory = lambda cursor, row: dict(zip([col[0] for col in cursor.description], row))
+            conn.row_factory = sqlite3.Row
             c = conn.cursor()
+
+            # Cheap change marker: configs only change via saves/deletes, so
+            # count + latest update timestamp identify the payload. A match
+            # lets us answer 304 without fetching or serializing anything.
+            c.execute('SELECT COUNT(*), MAX(updated_at) FROM dataset_configs')
+            count, last_updated = c.fetchone()
+            etag = f'{count}-{last_updated}'
+            if request.if_none_match.contains(etag):
+                conn.close()
+                return '', 304
+
             c.execute('SELECT * FROM dataset_configs ORDER BY created_at DESC')
             rows = c.fetchall()
             conn.close()
@@ -79,11 +172,13 @@ def dataset_configs():
             configs = []
             for row in rows:
                 config = dict(row)
-                config['selected_fields'] = json.loads(config['selected_fields'])
-                config['picklist_fields'] = json.loads(config.get('picklist_fields') or '[]')
+                config['selected_fields'] = _json_loads(config['selected_fields'])
+                config['picklist_fields'] = _json_loads(config.get('picklist_fields') or '[]')
                 configs.append(config)
 
-            return jsonify({'success': True, 'configs': configs})
+            response = jsonify({'success': True, 'configs': configs})
+            response.set_etag(etag)
+            return response
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -120,8 +215,8 @@ def dataset_configs():
                     data.get('crm_dataset_name', ''),
                     data['record_id_field'],
                     data.get('saql_filter', ''),
-                    json.dumps(data['selected_fields']),
-                    json.dumps(data.get('picklist_fields', [])),
+                    _json_dumps(data['selected_fields']),
+                    _json_dumps(data.get('picklist_fields', [])),
                     now,
                     config_id
                 ))
@@ -138,8 +233,8 @@ def dataset_configs():
                     data.get('crm_dataset_name', ''),
                     data['record_id_field'],
                     data.get('saql_filter', ''),
-                    json.dumps(data['selected_fields']),
-                    json.dumps(data.get('picklist_fields', [])),
+                    _json_dumps(data['selected_fields']),
+                    _json_dumps(data.get('picklist_fields', [])),
                     now,
                     now
                 ))
@@ -152,13 +247,77 @@ def dataset_configs():
             return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@dataset_bp.route('/api/dataset-configs/bulk', methods=['POST'])
+def dataset_configs_bulk():
+    """Create or replace several dataset configurations in one transaction
+
+    One commit (and therefore one fsync) covers the whole list instead of
+    paying a commit per config.
+    """
+    try:
+        configs = request.json.get('configs') or []
+        if not configs:
+            return jsonify({'success': False, 'error': 'configs list is required'}), 400
+
+        for data in configs:
+            if not data.get('name') or not data.get('crm_dataset_id') \
+                    or not data.get('record_id_field') or not data.get('selected_fields'):
+                return jsonify({
+                    'success': False,
+                    'error': 'Each config needs name, crm_dataset_id, record_id_field and selected_fields'
+                }), 400
+
+        now = datetime.utcnow().isoformat()
+        rows = []
+        ids = []
+        for data in configs:
+            config_id = data.get('id', str(uuid.uuid4()))
+            ids.append(config_id)
+            rows.append((
+                config_id,
+                data['name'],
+                data['crm_dataset_id'],
+                data.get('crm_dataset_name', ''),
+                data['record_id_field'],
+                data.get('saql_filter', ''),
+                _json_dumps(data['selected_fields']),
+                _json_dumps(data.get('picklist_fields', [])),
+                now,
+                now
+            ))
+
+        conn = get_connection()
+        c = conn.cursor()
+        c.executemany('''
+            INSERT INTO dataset_configs
+            (id, name, crm_dataset_id, crm_dataset_name, record_id_field,
+             saql_filter, selected_fields, picklist_fields, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                name=excluded.name,
+                crm_dataset_id=excluded.crm_dataset_id,
+                crm_dataset_name=excluded.crm_dataset_name,
+                record_id_field=excluded.record_id_field,
+                saql_filter=excluded.saql_filter,
+                selected_fields=excluded.selected_fields,
+                picklist_fields=excluded.picklist_fields,
+                updated_at=excluded.updated_at
+        ''', rows)
+        conn.commit()
+        conn.close()
+
+        return jsonify({'success': True, 'ids': ids, 'message': f'{len(ids)} dataset configurations saved'})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @dataset_bp.route('/api/dataset-configs/<config_id>', methods=['GET', 'DELETE'])
 def dataset_config_detail(config_id):
     """Get or delete a specific dataset configuration"""
     if request.method == 'GET':
         try:
             conn = get_connection()
-            conn.row_factory = lambda cursor, row: dict(zip([col[0] for col in cursor.description], row))
+            conn.row_factory = sqlite3.Row
             c = conn.cursor()
             c.execute('SELECT * FROM dataset_configs WHERE id=?', (config_id,))
             row = c.fetchone()
@@ -166,8 +325,8 @@ def dataset_config_detail(config_id):
 
             if row:
                 config = dict(row)
-                config['selected_fields'] = json.loads(config['selected_fields'])
-                config['picklist_fields'] = json.loads(config.get('picklist_fields') or '[]')
+                config['selected_fields'] = _json_loads(config['selected_fields'])
+                config['picklist_fields'] = _json_loads(config.get('picklist_fields') or '[]')
                 return jsonify({'success': True, 'config': config})
             else:
                 return jsonify({'success': False, 'error': 'Dataset configuration not found'}), 404
@@ -198,15 +357,19 @@ def test_saql_filter():
         if not dataset_id:
             return jsonify({'success': False, 'error': 'Dataset ID is required'}), 400
 
-        client = get_sf_client_func()
+        # An empty filter is trivially valid; skip the Salesforce round-trip
+        if not saql_filter:
+            return jsonify({'success': True, 'record_count': 0, 'message': 'Filter is valid'})
+
+        cache_key = (dataset_id, saql_filter)
+        cached = _filter_cache.get(cache_key)
+        if cached and time.time() - cached[0] < FILTER_CACHE_TTL:
+            return jsonify(cached[1])
 
-        # Get dataset info to retrieve currentVersionId
-        dataset_url = f"{client.instance_url}/services/data/{client.api_version}/wave/datasets/{dataset_id}"
-        dataset_response = requests.get(dataset_url, headers=client._get_headers())
-        dataset_response.raise_for_status()
-        dataset_data = dataset_response.json()
+        client = get_sf_client_func()
 
-        version_id = dataset_data.get('currentVersionId')
+        # Resolve the dataset version (cached, so repeat calls skip the round-trip)
+        version_id = _get_dataset_version(client, dataset_id)
         if not version_id:
             return jsonify({'success': False, 'error': 'Could not find dataset version'}), 400
 
@@ -221,7 +384,7 @@ def test_saql_filter():
 
         # Execute query
         url = f"{client.instance_url}/services/data/{client.api_version}/wave/query"
-        response = requests.post(url, headers=client._get_headers(), json={'query': saql})
+        response = client._make_request('POST', url, json={'query': saql})
 
         if not response.ok:
             error_detail = response.text
@@ -239,11 +402,13 @@ def test_saql_filter():
         if 'results' in result_data and 'records' in result_data['results']:
             record_count = len(result_data['results']['records'])
 
-        return jsonify({
+        payload = {
             'success': True,
             'record_count': record_count,
             'message': 'Filter is valid'
-        })
+        }
+        _filter_cache[cache_key] = (time.time(), payload)
+        return jsonify(payload)
 
     except requests.exceptions.HTTPError as e:
         error_msg = str(e)
@@ -271,32 +436,13 @@ def get_distinct_values(dataset_id):
 
         client = get_sf_client_func()
 
-        # Get dataset info to retrieve currentVersionId
-        dataset_url = f"{client.instance_url}/services/data/{client.api_version}/wave/datasets/{dataset_id}"
-        dataset_response = requests.get(dataset_url, headers=client._get_headers())
-        dataset_response.raise_for_status()
-        dataset_data = dataset_response.json()
-
-        version_id = dataset_data.get('currentVersionId')
+        # Resolve the dataset version (cached, so repeat calls skip the round-trip)
+        version_id = _get_dataset_version(client, dataset_id)
         if not version_id:
             return jsonify({'success': False, 'error': 'Could not find dataset version'}), 400
 
-        # Build SAQL query to get distinct values
-        saql = f'q = load "{dataset_id}/{version_id}";'
-
-        # Apply dataset filter if provided
-        if saql_filter:
-            saql += f'\n{saql_filter}'
-
-        # Group by the field to get distinct values
-        saql += f'\nq = group q by \'{field_name}\';'
-        saql += f'\nq = foreach q generate \'{field_name}\' as value;'
-        saql += '\nq = order q by value asc;'  # Sort alphabetically
-        saql += '\nq = limit q 10000;'  # Limit to prevent too many values
-
         # Execute query
-        url = f"{client.instance_url}/services/data/{client.api_version}/wave/query"
-        response = requests.post(url, headers=client._get_headers(), json={'query': saql})
+        response = _query_distinct_values(client, dataset_id, version_id, field_name, saql_filter)
 
         if not response.ok:
             error_detail = response.text
@@ -308,21 +454,7 @@ def get_distinct_values(dataset_id):
                 pass
             return jsonify({'success': False, 'error': error_detail}), 400
 
-        # Extract distinct values from response
-        result_data = response.json()
-        distinct_values = []
-
-        if 'results' in result_data and 'records' in result_data['results']:
-            for record in result_data['results']['records']:
-                # CRM Analytics returns values in format {"value": actual_value}
-                if 'value' in record and record['value'] is not None:
-                    value = record['value']
-                    # Handle both direct values and wrapped values
-                    if isinstance(value, dict) and 'value' in value:
-                        value = value['value']
-                    # Convert to string and filter out empty/null
-                    if value is not None and str(value).strip():
-                        distinct_values.append(str(value))
+        distinct_values = _extract_distinct_values(response.json())
 
         return jsonify({
             'success': True,
@@ -341,3 +473,61 @@ def get_distinct_values(dataset_id):
         return jsonify({'success': False, 'error': error_msg}), 500
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@dataset_bp.route('/api/crm-analytics/datasets/<dataset_id>/distinct-values-batch', methods=['POST'])
+def get_distinct_values_batch(dataset_id):
+    """Get distinct values for several fields in one request
+
+    Amortizes the version lookup and connection setup over all fields: the
+    per-field SAQL queries reuse the cached currentVersionId and the
+    client's keep-alive session instead of paying both per field.
+    """
+    try:
+        data = request.json
+        field_names = data.get('field_names') or []
+        saql_filter = data.get('saql_filter', '').strip()
+
+        if not field_names:
+            return jsonify({'success': False, 'error': 'field_names is required'}), 400
+
+        client = get_sf_client_func()
+
+        version_id = _get_dataset_version(client, dataset_id)
+        if not version_id:
+            return jsonify({'success': False, 'error': 'Could not find dataset version'}), 400
+
+        # The Wave query API takes one SAQL stream per request, so the batch
+        # is expressed as concurrent per-field queries over the client's
+        # keep-alive session: wall time approaches the slowest single query
+        # instead of the sum, and each field keeps its own 10k limit and
+        # error reporting
+        def _one_field(field_name):
+            return _query_distinct_values(client, dataset_id, version_id,
+                                          field_name, saql_filter)
+
+        values_by_field = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=min(8, len(field_names))) as executor:
+            responses = executor.map(_one_field, field_names)
+            for field_name, response in zip(field_names, responses):
+                if response.ok:
+                    values_by_field[field_name] = _extract_distinct_values(response.json())
+                else:
+                    error_detail = response.text
+                    try:
+                        error_json = response.json()
+                        if 'message' in error_json:
+                            error_detail = error_json['message']
+                    except:
+                        pass
+                    errors[field_name] = error_detail
+
+        return jsonify({
+            'success': not errors,
+            'values': values_by_field,
+            'errors': errors
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -2,9 +2,12 @@
 Synthetic claims data generator routes (legacy functionality)
 These routes support the original synthetic data generation feature
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, g, Response, stream_with_context
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from utils.settings_utils import SETTINGS_FILE, load_settings, save_settings as write_settings_file
 
 
 synthetic_bp = Blueprint('synthetic', __name__)
@@ -17,10 +20,13 @@ _client_funcs = {
 
 
 def get_sf_client_func():
-    """Get Salesforce client using configured function"""
-    if _client_funcs['get_sf_client'] is None:
-        raise NotImplementedError("SF client getter not configured")
-    return _client_funcs['get_sf_client']()
+    """Get Salesforce client using configured function (cached per request)"""
+    client = getattr(g, 'sf_client', None)
+    if client is None:
+        if _client_funcs['get_sf_client'] is None:
+            raise NotImplementedError("SF client getter not configured")
+        client = g.sf_client = _client_funcs['get_sf_client']()
+    return client
 
 
 def get_lm_client_func():
@@ -48,21 +54,20 @@ def authenticate():
 def get_settings():
     """Get application settings"""
     try:
-        settings_file = 'settings.json'
-        if os.path.exists(settings_file):
-            with open(settings_file, 'r') as f:
-                settings = json.load(f)
-        else:
-            # Default settings
-            settings = {
-                'provider': os.getenv('LLM_PROVIDER', 'lm_studio'),
-                'endpoint': os.getenv('LM_STUDIO_ENDPOINT', 'http://localhost:1234'),
-                'model': os.getenv('LLM_MODEL', 'gpt-4o-mini'),
-                'temperature': float(os.getenv('LLM_TEMPERATURE', '0.7')),
-                'max_tokens': int(os.getenv('LLM_MAX_TOKENS', '4000')),
-                'timeout': 60
-            }
-        return jsonify({'success': True, 'settings': settings})
+        # The file mtime doubles as an ETag so unchanged settings answer 304
+        # without serializing; the loader itself is mtime-cached too
+        try:
+            etag = str(os.stat(SETTINGS_FILE).st_mtime_ns)
+        except OSError:
+            etag = None
+
+        if etag and request.if_none_match.contains(etag):
+            return '', 304
+
+        response = jsonify({'success': True, 'settings': load_settings()})
+        if etag:
+            response.set_etag(etag)
+        return response
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -72,11 +77,9 @@ def save_settings():
     """Save application settings"""
     try:
         data = request.json
-        settings_file = 'settings.json'
 
-        # Save to file
-        with open(settings_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        # Atomic write via temp file + os.replace
+        write_settings_file(data)
 
         # Update LM client configuration
         lm_client = get_lm_client_func()
@@ -167,91 +170,237 @@ def test_prompt():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-@synthetic_bp.route('/api/batch-generate', methods=['POST'])
-def batch_generate():
-    """Run batch generation - either update existing or create new records"""
-    try:
-        from prompt_engine import PromptEngine
-
-        data = request.json
-        prompt_template = data.get('prompt_template')
-        target_field = data.get('target_field')
-        mode = data.get('mode', 'update')  # 'update' or 'insert'
-        insert_count = data.get('insert_count', 10)
-
-        if not all([prompt_template, target_field]):
-            return jsonify({'success': False, 'error': 'Missing required parameters'}), 400
-
-        sf_client = get_sf_client_func()
-        lm_client = get_lm_client_func()
-        prompt_engine = PromptEngine()
-
-        results = {
-            'total': 0,
-            'success': 0,
-            'failed': 0,
-            'errors': []
+def _batch_generate_events(data, sf_client, lm_client):
+    """Run batch generation, yielding progress dicts as work completes
+
+    Progress events carry {'done': False, 'processed', 'total', 'success',
+    'failed'}; the final event is {'done': True, 'results': results} with the
+    same results shape the endpoint has always returned.
+    """
+    from prompt_engine import PromptEngine
+
+    prompt_template = data.get('prompt_template')
+    target_field = data.get('target_field')
+    mode = data.get('mode', 'update')  # 'update' or 'insert'
+    insert_count = data.get('insert_count', 10)
+
+    prompt_engine = PromptEngine()
+    # Parse the template once; rendering is then a join over pre-split
+    # segments instead of a regex pass per record
+    compiled_template = prompt_engine.compile(prompt_template)
+
+    results = {
+        'total': 0,
+        'success': 0,
+        'failed': 0,
+        'errors': []
+    }
+
+    def progress(processed):
+        return {
+            'done': False,
+            'processed': processed,
+            'total': results['total'],
+            'success': results['success'],
+            'failed': results['failed']
         }
 
-        if mode == 'update':
-            # Update existing records
-            records = sf_client.get_all_records()
-            results['total'] = len(records)
-
-            for i, record in enumerate(records):
+    batch_size = data.get('batch_size', 8)
+
+    if mode == 'update':
+        # Update existing records: generate completions slice by slice and
+        # pipeline the Salesforce updates behind the LLM work — while the
+        # updater thread PATCHes one slice via sObject Collections, the LLM
+        # generates the next, so wall time approaches max(T_llm, T_sf)
+        # instead of their sum.
+        # Only query the fields the template actually references; pulling the
+        # default 50-field SELECT moves far more bytes than the prompts need.
+        # Template variables that don't exist on Claim__c are kept out of the
+        # SELECT — Salesforce rejects the whole query (MALFORMED_QUERY) for an
+        # unknown column — and render as "[field: not provided]" as before.
+        # iter_all_records follows queryMore pagination lazily, so tables
+        # beyond the 2000-row query cap are neither truncated nor buffered
+        claim_field_names = {f['name'] for f in sf_client.get_claim_fields()}
+        template_fields = dict.fromkeys(
+            name for name in compiled_template.variables
+            if name != 'Id' and name in claim_field_names
+        )
+        records_iter = sf_client.iter_all_records(fields=['Id'] + list(template_fields))
+
+        slice_size = 200  # matches the sObject Collections chunk size
+        update_futures = []  # (records in the slice, future for its statuses)
+
+        with ThreadPoolExecutor(max_workers=1) as updater:
+            while True:
+                slice_records = list(islice(records_iter, slice_size))
+                if not slice_records:
+                    break
+
+                results['total'] += len(slice_records)
+                prompts = [compiled_template.render(record) for record in slice_records]
+                completions = lm_client.batch_generate(prompts, batch_size=batch_size)
+
+                updates = []
+                updated_records = []
+                for record, completion in zip(slice_records, completions):
+                    if isinstance(completion, Exception):
+                        results['failed'] += 1
+                        results['errors'].append({
+                            'record_id': record['Id'],
+                            'error': str(completion)
+                        })
+                        print(f"Error generating for {record['Id']}: {str(completion)}")
+                        continue
+                    updates.append({'Id': record['Id'], target_field: completion})
+                    updated_records.append(record)
+
+                if updates:
+                    update_futures.append(
+                        (updated_records, updater.submit(sf_client.update_records, updates))
+                    )
+
+                yield progress(results['total'])
+
+            for updated_records, future in update_futures:
                 try:
-                    # Build prompt
-                    prompt = prompt_engine.build_prompt(prompt_template, record)
-
-                    # Generate completion
-                    completion = lm_client.generate(prompt)
-
-                    # Update Salesforce
-                    sf_client.update_record(record['Id'], {target_field: completion})
-
-                    results['success'] += 1
-                    print(f"Updated {i+1}/{len(records)}: {record['Id']}")
-
+                    statuses = future.result()
                 except Exception as e:
-                    results['failed'] += 1
+                    for record in updated_records:
+                        results['failed'] += 1
+                        results['errors'].append({
+                            'record_id': record['Id'],
+                            'error': str(e)
+                        })
+                    print(f"Error updating records: {str(e)}")
+                    continue
+
+                for record, status in zip(updated_records, statuses):
+                    if status.get('success'):
+                        results['success'] += 1
+                    else:
+                        results['failed'] += 1
+                        messages = '; '.join(
+                            err.get('message', str(err)) for err in status.get('errors', [])
+                        )
+                        results['errors'].append({
+                            'record_id': record['Id'],
+                            'error': messages or 'Update failed'
+                        })
+
+        print(f"Updated {results['success']}/{results['total']} records")
+
+    elif mode == 'insert':
+        # Create new records. The prompt should be written to not depend
+        # on existing field values; each gets an empty record as context
+        results['total'] = insert_count
+
+        prompts = [
+            compiled_template.render({'Id': f'NEW_{i+1}'})
+            for i in range(insert_count)
+        ]
+        # Insert prompts are often identical apart from the counter; each new
+        # record should still get its own sample, so skip prompt dedup here
+        completions = lm_client.batch_generate(prompts, batch_size=batch_size, dedupe=False)
+
+        pending = []
+        for i, completion in enumerate(completions):
+            if isinstance(completion, Exception):
+                results['failed'] += 1
+                results['errors'].append({
+                    'record_number': i + 1,
+                    'error': str(completion)
+                })
+                print(f"Error generating record {i+1}: {str(completion)}")
+                continue
+            pending.append((i, completion))
+
+        yield progress(insert_count)
+
+        # Creates have no collections endpoint counterpart here, so overlap
+        # the per-record POSTs over the client's pooled session instead of
+        # paying each round trip serially
+        def create_one(item):
+            i, completion = item
+            try:
+                return i, sf_client.create_record({target_field: completion}), None
+            except Exception as e:
+                return i, None, e
+
+        if len(pending) > 50:
+            # Large batches go through a single Bulk API 2.0 ingest job
+            # instead of hundreds of individual POSTs
+            try:
+                job = sf_client.bulk_create(
+                    [{target_field: completion} for _, completion in pending]
+                )
+                processed = job.get('numberRecordsProcessed', len(pending))
+                failed = job.get('numberRecordsFailed', 0)
+                results['success'] += processed - failed
+                if failed:
+                    results['failed'] += failed
                     results['errors'].append({
-                        'record_id': record['Id'],
-                        'error': str(e)
+                        'error': f"{failed} records failed in bulk ingest job {job.get('id')}"
                     })
-                    print(f"Error updating {record['Id']}: {str(e)}")
+                print(f"Bulk created {processed - failed}/{len(pending)} records")
+            except Exception as e:
+                results['failed'] += len(pending)
+                results['errors'].append({'error': str(e)})
+                print(f"Error bulk creating records: {str(e)}")
+        elif pending:
+            with ThreadPoolExecutor(max_workers=min(10, len(pending))) as executor:
+                for i, record_id, error in executor.map(create_one, pending):
+                    if error is None:
+                        results['success'] += 1
+                        print(f"Created {i+1}/{insert_count}: {record_id}")
+                    else:
+                        results['failed'] += 1
+                        results['errors'].append({
+                            'record_number': i + 1,
+                            'error': str(error)
+                        })
+                        print(f"Error creating record {i+1}: {str(error)}")
+
+    yield {'done': True, 'results': results}
 
-        elif mode == 'insert':
-            # Create new records
-            results['total'] = insert_count
 
-            for i in range(insert_count):
-                try:
-                    # For new records, we'll use an empty record as context
-                    # The prompt should be written to not depend on existing field values
-                    empty_record = {'Id': f'NEW_{i+1}'}
-
-                    # Build prompt
-                    prompt = prompt_engine.build_prompt(prompt_template, empty_record)
+@synthetic_bp.route('/api/batch-generate', methods=['POST'])
+def batch_generate():
+    """Run batch generation - either update existing or create new records
 
-                    # Generate completion
-                    completion = lm_client.generate(prompt)
+    Pass stream=true to receive incremental progress as Server-Sent Events;
+    the default response stays a single JSON body for existing callers.
+    """
+    data = request.json
+    if not all([data.get('prompt_template'), data.get('target_field')]):
+        return jsonify({'success': False, 'error': 'Missing required parameters'}), 400
 
-                    # Create new Salesforce record with generated content
-                    record_id = sf_client.create_record({target_field: completion})
+    try:
+        sf_client = get_sf_client_func()
+        lm_client = get_lm_client_func()
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-                    results['success'] += 1
-                    print(f"Created {i+1}/{insert_count}: {record_id}")
+    events = _batch_generate_events(data, sf_client, lm_client)
 
-                except Exception as e:
-                    results['failed'] += 1
-                    results['errors'].append({
-                        'record_number': i + 1,
-                        'error': str(e)
-                    })
-                    print(f"Error creating record {i+1}: {str(e)}")
+    if data.get('stream'):
+        def generate():
+            try:
+                for event in events:
+                    yield f"data: {json.dumps(event)}\n\n"
+            except Exception as e:
+                yield f"data: {json.dumps({'done': True, 'error': str(e)})}\n\n"
 
-        return jsonify({'success': True, 'results': results})
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
 
+    try:
+        final = None
+        for final in events:
+            pass
+        return jsonify({'success': True, 'results': final['results']})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
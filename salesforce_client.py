@@ -3,37 +3,87 @@ Salesforce Client Module
 Handles authentication and CRUD operations for Claim__c object
 """
 
-import os
+import csv
+import io
 import json
-import subprocess
+import logging
+import time
 import requests
-from typing import Dict, List, Optional
+import sfdcJwtAuth
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json(response: requests.Response):
+    """Decode a response body with orjson when available (2x+ on large payloads)"""
+    return orjson.loads(response.content) if orjson else response.json()
+
+
+logger = logging.getLogger(__name__)
+
+# Dataset schemas change rarely; cache field lists briefly so preview and
+# proving-ground clicks don't each pay a Salesforce round-trip
+DATASET_FIELDS_CACHE_TTL = 300  # seconds
+
+# sObject Collections accepts at most 200 records per request
+SOBJECT_COLLECTIONS_CHUNK_SIZE = 200
+
+# The Claim__c schema changes rarely; hold the describe result for an hour so
+# record fetches don't each pay a full /describe round-trip first
+CLAIM_FIELDS_CACHE_TTL = 3600  # seconds
+
+# Dataset versions only change when a dataflow republishes, so skip the
+# per-query dataset GET while the cached version is fresh
+DATASET_VERSION_CACHE_TTL = 300  # seconds
 
 class SalesforceClient:
     def __init__(self):
         self.access_token = None
         self.instance_url = None
+        self._token_expiry = 0  # epoch seconds; refresh proactively near this
         self.api_version = 'v60.0'
+        self._dataset_fields_cache = {}  # dataset_id -> (fetched_at, fields)
+        self._claim_fields_cache = None  # (fetched_at, fields)
+        self._claim_query_fields = None  # (fields list identity, comma-joined str)
+        self._dataset_version_cache = {}  # dataset_id -> (fetched_at, version_id)
+        # Pooled keep-alive session: the client is a process-wide singleton,
+        # so API calls reuse TLS connections instead of handshaking each time.
+        # Sessions are thread-safe for the request methods used here.
+        # Transient Salesforce errors (429 rate limits, 5xx blips) retry with
+        # exponential backoff at the transport layer, reusing the keep-alive
+        # connection; 401 is deliberately excluded — _make_request handles it
+        # with a token refresh.
+        retry = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'],
+            respect_retry_after_header=True
+        )
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=20, pool_maxsize=50, max_retries=retry)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
 
     def authenticate(self) -> bool:
         """Authenticate to Salesforce using JWT via Python script"""
         try:
-            # Set environment variables
-            env = os.environ.copy()
-            env['SFDC_USERNAME'] = os.getenv('SFDC_USERNAME')
-            env['KEY_PASS'] = os.getenv('KEY_PASS')
-            env['SFDC_CLIENT_ID'] = os.getenv('SFDC_CLIENT_ID')
-            env['SFDC_LOGIN_URL'] = os.getenv('SFDC_LOGIN_URL', 'https://login.salesforce.com')
-
-            # Import the Python authentication module from current directory
-            import sfdcJwtAuth
-
             # Call the authorize function
             result = sfdcJwtAuth.authorize()
 
             self.access_token = result['accessToken']
             self.instance_url = result['instanceUrl']
-            print(f"Retrieved credentials: {self.instance_url}")
+            # Refresh 30s before the token actually expires so in-flight
+            # requests don't race the cutoff
+            self._token_expiry = result.get('expiry') or (time.time() + 2 * 60 * 60)
+            logger.info("Retrieved credentials: %s", self.instance_url)
 
             if not self.access_token or not self.instance_url:
                 raise Exception("Could not retrieve access token or instance URL")
@@ -54,32 +104,37 @@ class SalesforceClient:
 
     def _make_request(self, method: str, url: str, **kwargs) -> requests.Response:
         """Make HTTP request with automatic token refresh on 401"""
-        # If no token, authenticate first
-        if not self.access_token:
-            print("No access token, authenticating...")
+        # Authenticate up front when there is no token or it is about to
+        # expire, rather than paying a doomed request plus 401 round-trip
+        if not self.access_token or time.time() > self._token_expiry - 30:
+            logger.info("No access token or token near expiry, authenticating...")
             self.authenticate()
 
         headers = kwargs.pop('headers', self._get_headers())
 
         # Make the request
-        response = requests.request(method, url, headers=headers, **kwargs)
+        response = self._session.request(method, url, headers=headers, **kwargs)
 
         # If unauthorized, re-authenticate and retry once
         if response.status_code == 401:
-            print("Access token expired, re-authenticating...")
+            logger.info("Access token expired, re-authenticating...")
             self.authenticate()
             headers = self._get_headers()
-            response = requests.request(method, url, headers=headers, **kwargs)
+            response = self._session.request(method, url, headers=headers, **kwargs)
 
         return response
 
     def get_claim_fields(self) -> List[Dict]:
-        """Get all fields from Claim__c object"""
+        """Get all fields from Claim__c object (cached for an hour)"""
+        cached = self._claim_fields_cache
+        if cached and time.time() - cached[0] < CLAIM_FIELDS_CACHE_TTL:
+            return cached[1]
+
         url = f"{self.instance_url}/services/data/{self.api_version}/sobjects/Claim__c/describe"
         response = self._make_request('GET', url)
         response.raise_for_status()
 
-        data = response.json()
+        data = _json(response)
         fields = []
 
         for field in data['fields']:
@@ -92,74 +147,177 @@ class SalesforceClient:
                 'createable': field['createable']
             })
 
+        self._claim_fields_cache = (time.time(), fields)
         return fields
 
-    def get_all_records(self, fields: Optional[List[str]] = None) -> List[Dict]:
-        """Get all Claim__c records"""
-        if fields is None:
-            # Get all fields first
-            all_fields = self.get_claim_fields()
-            # Filter to queryable fields
-            fields = ['Id'] + [f['name'] for f in all_fields if f['name'] not in ['Id'] and f['type'] != 'address'][:50]
+    def _claim_query_fields_str(self) -> str:
+        """Comma-joined queryable Claim__c field list for SELECT clauses
+
+        Derived from the cached describe result and memoized against it, so
+        the filter/join over ~50 field dicts runs once per describe fetch
+        instead of once per record query.
+        """
+        all_fields = self.get_claim_fields()
+        cached = self._claim_query_fields
+        if cached and cached[0] is all_fields:
+            return cached[1]
 
+        # Filter to queryable fields
+        fields = ['Id'] + [f['name'] for f in all_fields if f['name'] not in ['Id'] and f['type'] != 'address'][:50]
         fields_str = ', '.join(fields)
+        self._claim_query_fields = (all_fields, fields_str)
+        return fields_str
+
+    def iter_all_records(self, fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        """Iterate over all Claim__c records, following queryMore pagination
+
+        A single query response is capped at 2000 rows; this follows
+        nextRecordsUrl until exhausted and yields records page by page, so
+        callers can process arbitrarily large tables without buffering them.
+        """
+        if fields is None:
+            fields_str = self._claim_query_fields_str()
+        else:
+            fields_str = ', '.join(fields)
         query = f"SELECT {fields_str} FROM Claim__c"
 
         url = f"{self.instance_url}/services/data/{self.api_version}/query"
-        params = {'q': query}
-
-        response = self._make_request('GET', url, params=params)
+        response = self._make_request('GET', url, params={'q': query})
         response.raise_for_status()
+        data = _json(response)
 
-        data = response.json()
-        return data.get('records', [])
+        while True:
+            yield from data.get('records', [])
 
-    def get_record(self, record_id: str) -> Dict:
-        """Get a single Claim__c record by ID"""
-        # Get all fields
-        all_fields = self.get_claim_fields()
-        fields = ['Id'] + [f['name'] for f in all_fields if f['name'] not in ['Id'] and f['type'] != 'address'][:50]
-        fields_str = ', '.join(fields)
+            next_url = data.get('nextRecordsUrl')
+            if not next_url:
+                break
 
-        query = f"SELECT {fields_str} FROM Claim__c WHERE Id = '{record_id}'"
-        url = f"{self.instance_url}/services/data/{self.api_version}/query"
-        params = {'q': query}
+            response = self._make_request('GET', f"{self.instance_url}{next_url}")
+            response.raise_for_status()
+            data = _json(response)
 
-        response = self._make_request('GET', url, params=params)
-        response.raise_for_status()
+    def get_all_records(self, fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get all Claim__c records (buffered; see iter_all_records to stream)"""
+        return list(self.iter_all_records(fields))
+
+    def get_record(self, record_id: str) -> Dict:
+        """Get a single Claim__c record by ID
+
+        Uses the REST sobjects endpoint, which returns the record in a single
+        GET — no describe call and no SOQL parse/plan for a by-Id lookup.
+        """
+        url = f"{self.instance_url}/services/data/{self.api_version}/sobjects/Claim__c/{quote(record_id, safe='')}"
 
-        data = response.json()
-        records = data.get('records', [])
+        response = self._make_request('GET', url)
 
-        if not records:
+        if response.status_code == 404:
             raise Exception(f"Record not found: {record_id}")
+        response.raise_for_status()
 
-        return records[0]
+        return _json(response)
 
     def update_record(self, record_id: str, fields: Dict) -> bool:
         """Update a Claim__c record"""
-        url = f"{self.instance_url}/services/data/{self.api_version}/sobjects/Claim__c/{record_id}"
+        url = f"{self.instance_url}/services/data/{self.api_version}/sobjects/Claim__c/{quote(record_id, safe='')}"
 
-        response = requests.patch(url, headers=self._get_headers(), json=fields)
+        response = self._session.patch(url, headers=self._get_headers(), json=fields)
         response.raise_for_status()
 
         return True
 
+    def update_records(self, updates: List[Dict], sobject_type: str = 'Claim__c') -> List[Dict]:
+        """Update many records via the sObject Collections API
+
+        Each update dict must contain 'Id' plus the fields to set. Updates
+        are sent in chunks of 200 (the API maximum) with allOrNone=false,
+        collapsing N per-record PATCH round trips into ceil(N/200) calls.
+        Returns one {'id', 'success', 'errors'} status dict per input
+        record, in input order.
+        """
+        url = f"{self.instance_url}/services/data/{self.api_version}/composite/sobjects"
+        statuses = []
+
+        for start in range(0, len(updates), SOBJECT_COLLECTIONS_CHUNK_SIZE):
+            chunk = updates[start:start + SOBJECT_COLLECTIONS_CHUNK_SIZE]
+            payload = {
+                'allOrNone': False,
+                'records': [{'attributes': {'type': sobject_type}, **update} for update in chunk]
+            }
+            response = self._make_request('PATCH', url, json=payload)
+            response.raise_for_status()
+            statuses.extend(_json(response))
+
+        return statuses
+
+    def bulk_create(self, records: List[Dict], sobject_type: str = 'Claim__c',
+                    poll_interval: float = 2.0, timeout: float = 600.0) -> Dict:
+        """Insert many records via a Bulk API 2.0 ingest job
+
+        Serializes the records to CSV in memory, creates an ingest job,
+        uploads the CSV in one PUT, marks the job UploadComplete, and polls
+        until Salesforce finishes processing — a handful of HTTP calls for
+        any N instead of one POST per record. Returns the final job status
+        dict (includes numberRecordsProcessed / numberRecordsFailed).
+        """
+        fieldnames = sorted({name for record in records for name in record})
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(records)
+
+        jobs_url = f"{self.instance_url}/services/data/{self.api_version}/jobs/ingest"
+
+        response = self._make_request('POST', jobs_url, json={
+            'object': sobject_type,
+            'operation': 'insert',
+            'contentType': 'CSV',
+            'lineEnding': 'LF'
+        })
+        response.raise_for_status()
+        job_id = _json(response)['id']
+
+        upload_headers = dict(self._get_headers(), **{'Content-Type': 'text/csv'})
+        response = self._session.put(f"{jobs_url}/{job_id}/batches",
+                                     headers=upload_headers,
+                                     data=buffer.getvalue().encode('utf-8'))
+        response.raise_for_status()
+
+        response = self._make_request('PATCH', f"{jobs_url}/{job_id}",
+                                      json={'state': 'UploadComplete'})
+        response.raise_for_status()
+
+        deadline = time.time() + timeout
+        while True:
+            response = self._make_request('GET', f"{jobs_url}/{job_id}")
+            response.raise_for_status()
+            status = _json(response)
+            state = status.get('state')
+
+            if state == 'JobComplete':
+                return status
+            if state in ('Failed', 'Aborted'):
+                raise Exception(f"Bulk ingest job {job_id} {state.lower()}: {status.get('errorMessage', '')}")
+            if time.time() > deadline:
+                raise Exception(f"Bulk ingest job {job_id} timed out in state {state}")
+
+            time.sleep(poll_interval)
+
     def create_record(self, fields: Dict) -> str:
         """Create a new Claim__c record"""
         url = f"{self.instance_url}/services/data/{self.api_version}/sobjects/Claim__c"
 
-        response = requests.post(url, headers=self._get_headers(), json=fields)
+        response = self._session.post(url, headers=self._get_headers(), json=fields)
         response.raise_for_status()
 
-        data = response.json()
+        data = _json(response)
         return data['id']
 
     def delete_record(self, record_id: str) -> bool:
         """Delete a Claim__c record"""
-        url = f"{self.instance_url}/services/data/{self.api_version}/sobjects/Claim__c/{record_id}"
+        url = f"{self.instance_url}/services/data/{self.api_version}/sobjects/Claim__c/{quote(record_id, safe='')}"
 
-        response = requests.delete(url, headers=self._get_headers())
+        response = self._session.delete(url, headers=self._get_headers())
         response.raise_for_status()
 
         return True
@@ -172,7 +330,7 @@ class SalesforceClient:
         response = self._make_request('GET', url)
         response.raise_for_status()
 
-        data = response.json()
+        data = _json(response)
         datasets = []
 
         for dataset in data.get('datasets', []):
@@ -189,35 +347,50 @@ class SalesforceClient:
 
         return datasets
 
-    def get_dataset_fields(self, dataset_id: str) -> List[Dict]:
-        """Get fields from a CRM Analytics dataset"""
-        try:
-            # First get the dataset version
-            url = f"{self.instance_url}/services/data/{self.api_version}/wave/datasets/{dataset_id}"
+    def invalidate_dataset_fields(self, dataset_id: Optional[str] = None):
+        """Drop cached field lists (one dataset, or all if no ID given)"""
+        if dataset_id is None:
+            self._dataset_fields_cache.clear()
+        else:
+            self._dataset_fields_cache.pop(dataset_id, None)
 
-            print(f"Fetching dataset info from: {url}")
-            response = self._make_request('GET', url)
-            response.raise_for_status()
+    def _get_dataset_version(self, dataset_id: str) -> str:
+        """Get a dataset's currentVersionId, cached for a few minutes
 
-            data = response.json()
-            print(f"Dataset response: {json.dumps(data, indent=2)}")
+        Saves the dataset GET that otherwise precedes every SAQL query.
+        """
+        cached = self._dataset_version_cache.get(dataset_id)
+        if cached and time.time() - cached[0] < DATASET_VERSION_CACHE_TTL:
+            return cached[1]
 
-            version_id = data.get('currentVersionId')
+        url = f"{self.instance_url}/services/data/{self.api_version}/wave/datasets/{dataset_id}"
+        response = self._make_request('GET', url)
+        response.raise_for_status()
 
-            if not version_id:
-                print(f"No currentVersionId found in dataset data. Available keys: {data.keys()}")
-                raise Exception(f"Could not find version for dataset {dataset_id}")
+        version_id = _json(response).get('currentVersionId')
+        if not version_id:
+            raise Exception(f"Could not find currentVersionId for dataset {dataset_id}")
 
-            print(f"Found version_id: {version_id}")
+        self._dataset_version_cache[dataset_id] = (time.time(), version_id)
+        return version_id
+
+    def get_dataset_fields(self, dataset_id: str) -> List[Dict]:
+        """Get fields from a CRM Analytics dataset (cached for a few minutes)"""
+        cached = self._dataset_fields_cache.get(dataset_id)
+        if cached and time.time() - cached[0] < DATASET_FIELDS_CACHE_TTL:
+            return cached[1]
+
+        try:
+            # First get the dataset version
+            version_id = self._get_dataset_version(dataset_id)
 
             # Get the XMD (metadata) for the dataset
             xmd_url = f"{self.instance_url}/services/data/{self.api_version}/wave/datasets/{dataset_id}/versions/{version_id}/xmds/main"
 
-            print(f"Fetching XMD from: {xmd_url}")
             xmd_response = self._make_request('GET', xmd_url)
             xmd_response.raise_for_status()
 
-            xmd_data = xmd_response.json()
+            xmd_data = _json(xmd_response)
             fields = []
 
             # Extract fields from dimensions and measures
@@ -237,13 +410,12 @@ class SalesforceClient:
                     'dataType': measure.get('type', 'Numeric')
                 })
 
-            print(f"Found {len(fields)} fields")
+            logger.debug("Found %d fields for dataset %s", len(fields), dataset_id)
+            self._dataset_fields_cache[dataset_id] = (time.time(), fields)
             return fields
 
         except Exception as e:
-            print(f"Error in get_dataset_fields: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error in get_dataset_fields: %s", e)
             raise
 
     def query_dataset(self, dataset_id: str, fields: List[str], limit: int = 100, filters: Optional[Dict] = None, saql_filter: Optional[str] = None) -> List[Dict]:
@@ -257,18 +429,8 @@ class SalesforceClient:
             saql_filter: Raw SAQL filter statement (e.g., "q = filter q by 'Status' == 'Active';")
         """
         try:
-            # First, get the dataset to retrieve the currentVersionId
-            dataset_url = f"{self.instance_url}/services/data/{self.api_version}/wave/datasets/{dataset_id}"
-            dataset_response = self._make_request('GET', dataset_url)
-            dataset_response.raise_for_status()
-            dataset_data = dataset_response.json()
-
-            version_id = dataset_data.get('currentVersionId')
-            if not version_id:
-                raise Exception(f"Could not find currentVersionId for dataset {dataset_id}")
-
-            print(f"Dataset ID: {dataset_id}, Version ID: {version_id}")
-            print(f"Full dataset data: {dataset_data}")
+            # Resolve the dataset version (cached; usually no HTTP round trip)
+            version_id = self._get_dataset_version(dataset_id)
 
             # Build SAQL query using dataset_id/version_id format
             saql = f'q = load "{dataset_id}/{version_id}";'
@@ -287,13 +449,13 @@ class SalesforceClient:
                 filter_conditions = []
                 for field, value in filters.items():
                     if isinstance(value, list):
-                        # Use 'in' operator for list of values
-                        # SAQL syntax: 'field' in ["val1", "val2", "val3"]
-                        values_str = ', '.join([f'"{v}"' for v in value])
-                        filter_conditions.append(f"'{field}' in [{values_str}]")
+                        # Use 'in' operator for list of values; json.dumps
+                        # renders the SAQL list syntax ["val1", "val2"] with
+                        # embedded quotes escaped
+                        filter_conditions.append(f"'{field}' in {json.dumps([str(v) for v in value])}")
                     else:
                         # Single value - use equality
-                        filter_conditions.append(f"'{field}' == \"{value}\"")
+                        filter_conditions.append(f"'{field}' == {json.dumps(str(value))}")
                 if filter_conditions:
                     saql += f'\nq = filter q by {" && ".join(filter_conditions)};'
 
@@ -309,7 +471,7 @@ class SalesforceClient:
             # Add limit (must come after foreach)
             saql += f'\nq = limit q {limit};'
 
-            print(f"Executing SAQL query:\n{saql}")
+            logger.debug("Executing SAQL query:\n%s", saql)
 
             # Execute query
             url = f"{self.instance_url}/services/data/{self.api_version}/wave/query"
@@ -319,32 +481,29 @@ class SalesforceClient:
             # Check for errors
             if not response.ok:
                 error_detail = response.text
-                print(f"Query error: {error_detail}")
+                logger.error("Query error: %s", error_detail)
                 raise Exception(f"Query failed with status {response.status_code}: {error_detail}")
 
-            data = response.json()
-
-            print(f"Query response structure: {json.dumps(data, indent=2)}")
+            data = _json(response)
 
             # Extract results - CRM Analytics returns data in a specific structure
             results = []
             if 'results' in data and 'records' in data['results']:
                 raw_records = data['results']['records']
 
-                # Convert CRM Analytics record format to flat dictionary
-                for record in raw_records:
-                    flat_record = {}
-                    for key, value in record.items():
-                        # CRM Analytics wraps values in objects with type info
-                        if isinstance(value, dict) and 'value' in value:
-                            flat_record[key] = value['value']
-                        else:
-                            flat_record[key] = value
-                    results.append(flat_record)
-
-                print(f"Converted {len(results)} records to flat format")
+                # Convert CRM Analytics record format to flat dictionaries.
+                # The API wraps values in objects with type info; unwrap them
+                # in a single comprehension (type() rather than isinstance()
+                # skips the MRO walk on this limit * field_count hot loop).
+                results = [
+                    {key: (value['value'] if type(value) is dict and 'value' in value else value)
+                     for key, value in record.items()}
+                    for record in raw_records
+                ]
+
+                logger.debug("Converted %d records to flat format", len(results))
             else:
-                print(f"Unexpected response structure. Keys: {data.keys()}")
+                logger.warning("Unexpected response structure. Keys: %s", list(data.keys()))
 
             # Audit log PHI access
             try:
@@ -357,7 +516,7 @@ class SalesforceClient:
                     metadata={'fields': fields, 'limit': limit}
                 )
             except Exception as audit_error:
-                print(f"Warning: Failed to log audit event: {audit_error}")
+                logger.warning("Failed to log audit event: %s", audit_error)
 
             return results
 
@@ -1,25 +1,154 @@
 """
 Batch execution service for running LLM prompts against CRM Analytics datasets
 """
+import gzip
 import json
+import os
 import time
 import threading
+from collections import OrderedDict
 from datetime import datetime
 from database.db import get_connection
 from utils.json_utils import extract_json_from_llm_response
-from utils.csv_utils import generate_structured_csv
+from utils.csv_utils import generate_structured_csv, flatten_result_rows
 from prompt_engine import PromptEngine
 from audit_logger import get_audit_logger, AuditLogger
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-# Global state for batch executions (in-memory for now)
-batch_executions = {}
 
+class ExecutionRegistry:
+    """Thread-safe in-memory registry of batch executions
+
+    Executions are written by the background worker thread and read by the
+    HTTP polling endpoints, so every access goes through an RLock. A
+    secondary batch_id index makes status lookups O(1) instead of scanning
+    all executions, and the registry is bounded: once it grows past
+    max_entries, the oldest completed executions are evicted so long-running
+    servers don't accumulate state forever.
+
+    Dict-style access (in / [] / del) is kept so existing call sites read
+    the same as when this was a plain module-level dict.
+    """
+
+    def __init__(self, max_entries=100):
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
+        self._executions = OrderedDict()  # execution_id -> execution dict
+        self._by_batch = {}               # batch_id -> execution_id
+
+    def set(self, execution_id, execution):
+        with self._lock:
+            self._executions[execution_id] = execution
+            self._executions.move_to_end(execution_id)
+            batch_id = execution.get('batch_id')
+            if batch_id:
+                self._by_batch[batch_id] = execution_id
+            self._evict()
+
+    def get(self, execution_id):
+        with self._lock:
+            return self._executions.get(execution_id)
+
+    def find_by_batch(self, batch_id):
+        """Return the execution for a batch, or None"""
+        with self._lock:
+            execution_id = self._by_batch.get(batch_id)
+            if execution_id is None:
+                return None
+            return self._executions.get(execution_id)
+
+    def remove(self, execution_id):
+        with self._lock:
+            execution = self._executions.pop(execution_id, None)
+            if execution is not None:
+                batch_id = execution.get('batch_id')
+                if self._by_batch.get(batch_id) == execution_id:
+                    del self._by_batch[batch_id]
+
+    def _evict(self):
+        """Drop oldest completed executions once past max_entries (lock held)"""
+        if len(self._executions) <= self.max_entries:
+            return
+        for execution_id in list(self._executions):
+            if len(self._executions) <= self.max_entries:
+                break
+            if self._executions[execution_id].get('complete'):
+                self.remove(execution_id)
+
+    def __contains__(self, execution_id):
+        with self._lock:
+            return execution_id in self._executions
 
-def persist_execution_status(batch_id, execution):
-    """Persist execution status to database for resumption after server restart"""
+    def __getitem__(self, execution_id):
+        with self._lock:
+            return self._executions[execution_id]
+
+    def __setitem__(self, execution_id, execution):
+        self.set(execution_id, execution)
+
+    def __delitem__(self, execution_id):
+        self.remove(execution_id)
+
+
+# Global state for batch executions (in-memory for now)
+batch_executions = ExecutionRegistry()
+
+
+# Delayed cleanup goes through one shared reaper thread instead of a
+# dedicated sleeping thread per batch, so N concurrent batches don't hold
+# N idle stacks just to delete a registry entry 30 seconds later
+CLEANUP_DELAY = 30  # seconds; allows final status checks before eviction
+
+_cleanup_lock = threading.Lock()
+_cleanup_queue = []  # (deadline, execution_id), appended in deadline order
+_cleanup_thread = None
+
+
+def schedule_cleanup(execution_id, delay=CLEANUP_DELAY):
+    """Remove an execution from memory after a delay via the shared reaper"""
+    global _cleanup_thread
+    with _cleanup_lock:
+        _cleanup_queue.append((time.time() + delay, execution_id))
+        if _cleanup_thread is None or not _cleanup_thread.is_alive():
+            _cleanup_thread = threading.Thread(target=_cleanup_reaper, daemon=True)
+            _cleanup_thread.start()
+
+
+def _cleanup_reaper():
+    """Drain the cleanup queue; exits when idle and restarts on demand"""
+    while True:
+        with _cleanup_lock:
+            if not _cleanup_queue:
+                return
+            deadline, execution_id = _cleanup_queue[0]
+            if deadline <= time.time():
+                _cleanup_queue.pop(0)
+            else:
+                execution_id = None
+                wait = deadline - time.time()
+        if execution_id is None:
+            time.sleep(min(wait, 1.0))
+            continue
+        if execution_id in batch_executions:
+            print(f"Cleaning up execution {execution_id} from memory")
+            batch_executions.remove(execution_id)
+
+
+def persist_execution_status(batch_id, execution, conn=None):
+    """Persist execution status to database for resumption after server restart
+
+    Pass a batch-scoped connection to reuse it across progress ticks; it is
+    committed but left open for the caller. Without one, a pooled connection
+    is acquired and released per call.
+    """
+    own_conn = conn is None
     try:
-        conn = get_connection()
+        if own_conn:
+            conn = get_connection()
         c = conn.cursor()
         c.execute('''
             INSERT OR REPLACE INTO execution_status
@@ -41,7 +170,8 @@ def persist_execution_status(batch_id, execution):
             execution.get('error')
         ))
         conn.commit()
-        conn.close()
+        if own_conn:
+            conn.close()
     except Exception as e:
         print(f"Warning: Failed to persist execution status: {str(e)}")
 
@@ -57,15 +187,16 @@ def upload_to_crm_analytics(client, csv_data, filename):
 
         dataset_name = 'Structured_Response'
 
-        # Create a temporary file
-        temp_file = f'/tmp/{filename}'
-        with open(temp_file, 'w') as f:
-            f.write(csv_data)
+        # The upload itself is still a TODO, so writing the full CSV to /tmp
+        # on every batch is pure critical-path disk I/O; keep it opt-in for
+        # anyone who wants the file for manual upload
+        if os.getenv('WRITE_CSV_TMP'):
+            temp_file = f'/tmp/{filename}'
+            with open(temp_file, 'w') as f:
+                f.write(csv_data)
+            print(f"CSV saved to {temp_file} for manual upload if needed")
 
-        # Use sf CLI to upload (if available)
-        # This is a simplified approach - production should use the REST API
         print(f"CSV data prepared for upload to {dataset_name}")
-        print(f"CSV saved to {temp_file} for manual upload if needed")
 
         # TODO: Implement actual CRM Analytics Data API upload
         # For now, the CSV is available for download
@@ -86,13 +217,18 @@ def run_batch_execution(execution_id, batch_id, sf_client, lm_client, settings_l
         lm_client: LLM client instance
         settings_loader: Function to load global settings
     """
+    conn = None
     try:
         execution = batch_executions[execution_id]
         execution['status'] = 'Initializing...'
-        persist_execution_status(batch_id, execution)
 
-        # Get batch info
+        # One pooled connection serves the whole batch run — config reads,
+        # every progress tick, and the final history write — instead of an
+        # acquire/commit/release cycle per status update
         conn = get_connection()
+        persist_execution_status(batch_id, execution, conn)
+
+        # Get batch info
         c = conn.cursor()
         c.execute('SELECT * FROM batches WHERE id = ?', (batch_id,))
         batch_row = c.fetchone()
@@ -101,7 +237,6 @@ def run_batch_execution(execution_id, batch_id, sf_client, lm_client, settings_l
             execution['complete'] = True
             execution['success'] = False
             execution['error'] = 'Batch not found'
-            conn.close()
             return
 
         batch = {
@@ -112,11 +247,14 @@ def run_batch_execution(execution_id, batch_id, sf_client, lm_client, settings_l
             'dataset_config_id': batch_row[4]  # dataset_config_id
         }
 
-        # Get dataset configuration to find record ID field
+        # Get dataset configuration: record ID field and SAQL filter
+        saql_filter = ''
         if batch['dataset_config_id']:
-            c.execute('SELECT record_id_field FROM dataset_configs WHERE id = ?', (batch['dataset_config_id'],))
+            c.execute('SELECT record_id_field, saql_filter FROM dataset_configs WHERE id = ?', (batch['dataset_config_id'],))
             config_row = c.fetchone()
             record_id_field = config_row[0] if config_row else None
+            if config_row and config_row[1]:
+                saql_filter = config_row[1]
             print(f"Using record ID field from config: {record_id_field}")
         else:
             record_id_field = None
@@ -124,12 +262,12 @@ def run_batch_execution(execution_id, batch_id, sf_client, lm_client, settings_l
 
         # Delete old execution history for this batch (only keep latest)
         c.execute('DELETE FROM execution_history WHERE batch_id = ?', (batch_id,))
+        c.execute('DELETE FROM execution_results WHERE batch_id = ?', (batch_id,))
         conn.commit()
 
         # Get prompt configuration
         c.execute('SELECT * FROM prompts WHERE batch_id = ?', (batch_id,))
         prompt_row = c.fetchone()
-        conn.close()
 
         if not prompt_row:
             execution['complete'] = True
@@ -149,36 +287,33 @@ def run_batch_execution(execution_id, batch_id, sf_client, lm_client, settings_l
 
         execution['status'] = 'Loading dataset records...'
 
-        # Extract fields used in the prompt template
+        # Compile the template once: parsing is O(template length) and would
+        # otherwise be repaid for every record in the batch
         prompt_engine = PromptEngine()
-        template_fields = prompt_engine.extract_variables(prompt_config['template'])
+        compiled_template = prompt_engine.compile(prompt_config['template'])
+        template_fields = compiled_template.variables
 
-        # Get all available fields from dataset to validate
+        # Get all available fields from dataset to validate; membership tests
+        # below run once per template variable, so use a set rather than
+        # scanning a potentially hundreds-long field list each time
         fields_data = sf_client.get_dataset_fields(batch['dataset_id'])
         available_field_names = [f['name'] for f in fields_data]
+        available_fields_set = frozenset(available_field_names)
 
         # Start with template fields that exist in dataset
-        query_fields = [f for f in template_fields if f in available_field_names]
+        query_fields = [f for f in template_fields if f in available_fields_set]
+        query_fields_set = set(query_fields)
 
         # Add common ID/Name fields if they exist
         for field in ['Name', 'Title', 'Id', 'RecordId', 'ClaimNumber']:
-            if field in available_field_names and field not in query_fields:
+            if field in available_fields_set and field not in query_fields_set:
                 query_fields.append(field)
-
-        # Get SAQL filter from dataset configuration
-        saql_filter = ''
-        if batch['dataset_config_id']:
-            conn_temp = get_connection()
-            c_temp = conn_temp.cursor()
-            c_temp.execute('SELECT saql_filter FROM dataset_configs WHERE id = ?', (batch['dataset_config_id'],))
-            filter_row = c_temp.fetchone()
-            conn_temp.close()
-            if filter_row and filter_row[0]:
-                saql_filter = filter_row[0]
+                query_fields_set.add(field)
 
         # Ensure record ID field is in query fields
-        if record_id_field and record_id_field not in query_fields:
+        if record_id_field and record_id_field not in query_fields_set:
             query_fields.append(record_id_field)
+            query_fields_set.add(record_id_field)
 
         print(f"Batch execution - Template fields: {template_fields}")
         print(f"Batch execution - Available fields: {available_field_names[:20]}")
@@ -212,93 +347,128 @@ def run_batch_execution(execution_id, batch_id, sf_client, lm_client, settings_l
 
         execution['total'] = len(all_records)
         execution['status'] = f'Processing {len(all_records)} records...'
-        persist_execution_status(batch_id, execution)
+        persist_execution_status(batch_id, execution, conn)
 
         # Configure LLM client with global settings
         global_settings = settings_loader()
         lm_client.update_config(global_settings)
 
-        # Process each record
-        results = []
+        # Process records concurrently: each record is pure I/O against the
+        # LLM endpoint, so a bounded worker pool overlaps the per-record
+        # latency the serial loop paid one record at a time. Results are
+        # written back by index so CSV row order matches the query order.
+        llm_concurrency = 4
+        if isinstance(global_settings, dict):
+            llm_concurrency = int(global_settings.get('llm_concurrency', 4))
+
+        results = [None] * len(all_records)
         success_count = 0
         error_count = 0
         start_time = time.time()
 
-        for idx, record in enumerate(all_records):
-            try:
-                # Get record ID from configured field, fall back to common fields
-                if record_id_field:
-                    record_id = record.get(record_id_field) or f'Record_{idx}'
-                    if idx == 0:  # Log first record for debugging
-                        print(f"First record ID extracted from field '{record_id_field}': {record_id}")
-                else:
-                    record_id = record.get('Id') or record.get('id') or record.get('Name') or record.get('name') or f'Record_{idx}'
-                    if idx == 0:
-                        print(f"First record ID using fallback: {record_id}")
-
-                # Render prompt
-                rendered_prompt = prompt_engine.build_prompt(prompt_config['template'], record)
-
-                # Append schema if provided
-                if prompt_config['response_schema']:
-                    rendered_prompt += f"\n\nPlease respond ONLY with valid JSON matching this exact schema:\n{prompt_config['response_schema']}\n\nDo not include any explanatory text, only the JSON object."
-
-                # Execute with model
-                model_response = lm_client.generate(rendered_prompt)
-
-                # Parse JSON response
-                try:
-                    # Extract JSON from LLM response (handles special tokens and markdown)
-                    clean_response = extract_json_from_llm_response(model_response)
-                    response_json = json.loads(clean_response)
-                    success_count += 1
-                except json.JSONDecodeError:
-                    response_json = {'raw_response': model_response}
+        # Schema suffix is identical for every record; build it once
+        schema_suffix = ''
+        if prompt_config['response_schema']:
+            schema_suffix = f"\n\nPlease respond ONLY with valid JSON matching this exact schema:\n{prompt_config['response_schema']}\n\nDo not include any explanatory text, only the JSON object."
+
+        # Hoist loop-invariant lookups: each ['x'] / .get inside the loop is
+        # repaid per record, and the fallback key chain reduces to one tuple
+        batch_name = batch['name']
+        total_records = len(all_records)
+        id_keys = (record_id_field,) if record_id_field else ('Id', 'id', 'Name', 'name')
+
+        def record_id_for(idx, record):
+            """Record ID from the configured field, falling back to common fields"""
+            for key in id_keys:
+                value = record.get(key)
+                if value:
+                    return value
+            return f'Record_{idx}'
+
+        # Generate chunk by chunk through the client's batch path: prompts in
+        # a chunk are deduplicated, binned by length, and dispatched with
+        # llm_concurrency in-flight requests, while the chunk boundary keeps
+        # progress counters and status persists ticking for the UI
+        chunk_size = 64
+        for chunk_start in range(0, len(all_records), chunk_size):
+            chunk = all_records[chunk_start:chunk_start + chunk_size]
+            prompts = [
+                compiled_template.render(record) + schema_suffix
+                for record in chunk
+            ]
+            completions = lm_client.batch_generate(prompts, batch_size=llm_concurrency)
+
+            for offset, (record, completion) in enumerate(zip(chunk, completions)):
+                idx = chunk_start + offset
+
+                if isinstance(completion, Exception):
+                    print(f"Error processing record {idx}: {str(completion)}")
                     error_count += 1
-
-                results.append({
-                    'record_id': record_id,
-                    'batch_name': batch['name'],
-                    'response': response_json
-                })
-
-            except Exception as record_error:
-                print(f"Error processing record {idx}: {str(record_error)}")
-                error_count += 1
-                results.append({
-                    'record_id': record.get('Id') or record.get('id') or f'Record_{idx}',
-                    'batch_name': batch['name'],
-                    'response': {'error': str(record_error)}
-                })
-
-            # Update progress
-            execution['current'] = idx + 1
-            execution['success_count'] = success_count
-            execution['error_count'] = error_count
-            execution['status'] = f'Processing record {idx + 1} of {len(all_records)}'
-
-            # Persist status every 10 records
-            if (idx + 1) % 10 == 0:
-                persist_execution_status(batch_id, execution)
+                    results[idx] = {
+                        'record_id': record_id_for(idx, record),
+                        'batch_name': batch_name,
+                        'response': {'error': str(completion)}
+                    }
+                else:
+                    # Parse JSON response (extract_json handles special
+                    # tokens/markdown)
+                    try:
+                        clean_response = extract_json_from_llm_response(completion)
+                        # orjson's C parser cuts per-record parse time on the hot path
+                        if orjson:
+                            response_json = orjson.loads(clean_response)
+                        else:
+                            response_json = json.loads(clean_response)
+                        success_count += 1
+                    except (json.JSONDecodeError, ValueError):
+                        response_json = {'raw_response': completion}
+                        error_count += 1
+                    results[idx] = {
+                        'record_id': record_id_for(idx, record),
+                        'batch_name': batch_name,
+                        'response': response_json
+                    }
+
+                # Update progress
+                execution['current'] = idx + 1
+                execution['success_count'] = success_count
+                execution['error_count'] = error_count
+                execution['status'] = f'Processing record {idx + 1} of {total_records}'
+
+                # Persist status every 50 records; each persist commits, and
+                # even with WAL + synchronous=NORMAL commits aren't free
+                if (idx + 1) % 50 == 0:
+                    persist_execution_status(batch_id, execution, conn)
+
+        # Final persist so the status row reflects the last partial chunk
+        persist_execution_status(batch_id, execution, conn)
 
         # Generate structured CSV with dataset name and batch name
         execution['status'] = 'Generating CSV...'
         csv_data = generate_structured_csv(results, batch['dataset_name'], batch['name'], record_id_field)
         csv_filename = f"batch_{batch['name']}_{execution_id[:8]}.csv"
 
+        # Upload to Salesforce CRM Analytics
+        execution['status'] = 'Uploading to Salesforce...'
+        try:
+            upload_to_crm_analytics(sf_client, csv_data, csv_filename)
+        except Exception as upload_error:
+            print(f"Warning: Failed to upload to CRM Analytics: {str(upload_error)}")
+            # Continue anyway, CSV is still available for download
+
         # Save to execution history
         execution['status'] = 'Saving to history...'
+        history_saved = False
         try:
             end_time = time.time()
             execution_time = end_time - start_time
 
-            conn = get_connection()
             c = conn.cursor()
             c.execute('''
                 INSERT OR REPLACE INTO execution_history
                 (batch_id, batch_name, dataset_name, total_records, success_count,
-                 error_count, execution_time, csv_data, executed_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 error_count, execution_time, executed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 batch['id'],
                 batch['name'],
@@ -307,30 +477,45 @@ def run_batch_execution(execution_id, batch_id, sf_client, lm_client, settings_l
                 success_count,
                 error_count,
                 execution_time,
-                csv_data,
                 datetime.now().isoformat()
             ))
-            conn.commit()
-            conn.close()
-            print(f"Saved execution history for batch {batch['id']}")
+
+            # CSV blob goes in its own table so history listings stay narrow
+            c.execute('''
+                INSERT OR REPLACE INTO execution_history_csv (batch_id, csv_data)
+                VALUES (?, ?)
+            ''', (batch['id'], csv_data))
+
+            # Persist normalized per-record results so the combined-CSV merge
+            # can run as a single SQL query instead of re-parsing CSV blobs
+            result_rows = flatten_result_rows(results)
+            c.execute('DELETE FROM execution_results WHERE batch_id = ?', (batch['id'],))
+            c.executemany('''
+                INSERT INTO execution_results (batch_id, record_id, column_name, value)
+                VALUES (?, ?, ?, ?)
+            ''', [(batch['id'], record_id, column_name, value)
+                  for record_id, column_name, value in result_rows])
+
+            # No commit here: the history rows land in the same transaction
+            # as the final status write below, so the "done" transition and
+            # its history are atomic (one fsync instead of two)
+            history_saved = True
         except Exception as hist_error:
+            conn.rollback()
             print(f"Warning: Failed to save execution history: {str(hist_error)}")
 
-        # Upload to Salesforce CRM Analytics
-        execution['status'] = 'Uploading to Salesforce...'
-        try:
-            upload_to_crm_analytics(sf_client, csv_data, csv_filename)
-        except Exception as upload_error:
-            print(f"Warning: Failed to upload to CRM Analytics: {str(upload_error)}")
-            # Continue anyway, CSV is still available for download
-
-        # Mark as complete
+        # Mark as complete. Store the CSV gzip-compressed: downloads can send
+        # the bytes as-is with Content-Encoding: gzip, and we avoid keeping a
+        # large uncompressed string (plus a second encoded copy per download)
+        # in memory for the lifetime of the execution entry.
         execution['complete'] = True
         execution['success'] = True
-        execution['csv_data'] = csv_data
+        execution['csv_gz'] = gzip.compress(csv_data.encode('utf-8'))
         execution['csv_filename'] = csv_filename
         execution['status'] = 'Complete'
-        persist_execution_status(batch_id, execution)
+        persist_execution_status(batch_id, execution, conn)
+        if history_saved:
+            print(f"Saved execution history for batch {batch['id']}")
 
         # Audit log successful execution
         audit_logger = get_audit_logger()
@@ -348,15 +533,7 @@ def run_batch_execution(execution_id, batch_id, sf_client, lm_client, settings_l
         )
 
         # Clean up from memory after a delay (allow final status check)
-        def cleanup_execution():
-            time.sleep(30)  # Wait 30 seconds before cleanup
-            if execution_id in batch_executions:
-                print(f"Cleaning up completed execution {execution_id} from memory")
-                del batch_executions[execution_id]
-
-        cleanup_thread = threading.Thread(target=cleanup_execution)
-        cleanup_thread.daemon = True
-        cleanup_thread.start()
+        schedule_cleanup(execution_id)
 
     except Exception as e:
         print(f"Error in batch execution: {str(e)}")
@@ -365,6 +542,7 @@ def run_batch_execution(execution_id, batch_id, sf_client, lm_client, settings_l
         execution['complete'] = True
         execution['success'] = False
         execution['error'] = str(e)
+        # The batch connection may itself be what failed; persist on a fresh one
         persist_execution_status(batch_id, execution)
 
         # Audit log failed execution
@@ -379,12 +557,8 @@ def run_batch_execution(execution_id, batch_id, sf_client, lm_client, settings_l
         )
 
         # Clean up from memory after a delay (even on error)
-        def cleanup_execution():
-            time.sleep(30)  # Wait 30 seconds before cleanup
-            if execution_id in batch_executions:
-                print(f"Cleaning up failed execution {execution_id} from memory")
-                del batch_executions[execution_id]
-
-        cleanup_thread = threading.Thread(target=cleanup_execution)
-        cleanup_thread.daemon = True
-        cleanup_thread.start()
+        schedule_cleanup(execution_id)
+
+    finally:
+        if conn is not None:
+            conn.close()
@@ -2,7 +2,7 @@
 Schema generation service for creating JSON schemas from natural language descriptions
 """
 import json
-from utils.json_utils import extract_json_from_llm_response
+from utils.json_utils import extract_json_from_llm_response, json_loads
 
 
 def generate_schema_from_description(description, lm_client):
@@ -47,11 +47,8 @@ Return ONLY the JSON schema, nothing else. Use descriptive field names and appro
         # Extract JSON from LLM response (handles special tokens and markdown)
         schema_text = extract_json_from_llm_response(schema_text)
 
-        # Validate that it's valid JSON
-        json.loads(schema_text)
-
-        # Format it nicely
-        schema_obj = json.loads(schema_text)
+        # Parse once: this validates the JSON and feeds the formatting below
+        schema_obj = json_loads(schema_text)
         formatted_schema = json.dumps(schema_obj, indent=2)
 
         return True, formatted_schema, None
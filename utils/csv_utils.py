@@ -3,8 +3,41 @@ CSV generation utilities for structured LLM response data
 """
 import csv
 import io
-import json
-from .json_utils import flatten_nested_dict
+from .json_utils import SCHEMA_METADATA_FIELDS, flatten_nested_dict
+
+
+def flatten_result_rows(results):
+    """
+    Flatten batch results into normalized (record_id, column_name, value) rows
+    for the execution_results table, so downstream merging can happen in SQL
+    instead of re-parsing CSV blobs in Python.
+
+    Args:
+        results: List of result dictionaries with 'record_id' and 'response'
+
+    Returns:
+        List of (record_id, column_name, value) tuples
+    """
+    rows = []
+    for result in results:
+        record_id = str(result['record_id'])
+        response = result.get('response', {})
+
+        if isinstance(response, dict):
+            flattened_response = flatten_nested_dict(response)
+        else:
+            flattened_response = {'raw_response': str(response)}
+
+        for column_name, value in flattened_response.items():
+            if column_name in SCHEMA_METADATA_FIELDS:
+                continue
+            if value is None:
+                value = ''
+            elif type(value) is not str:
+                value = str(value)
+            rows.append((record_id, column_name, value))
+
+    return rows
 
 
 def generate_structured_csv(results, dataset_name='', batch_name='', record_id_field='Record ID'):
@@ -23,61 +56,56 @@ def generate_structured_csv(results, dataset_name='', batch_name='', record_id_f
     output = io.StringIO()
     writer = csv.writer(output)
 
-    # JSON Schema metadata fields to exclude
-    schema_fields = {'$schema', 'type', 'properties', 'required', 'title', 'description',
-                     'definitions', 'additionalProperties', '$id', '$ref', 'items'}
-
-    # First pass: flatten all responses and collect unique field names
-    flattened_results = []
+    # First pass: collect unique field names only. The flattened dicts are
+    # discarded immediately instead of being held for every record at once,
+    # which kept a second full copy of all responses alive until the end.
+    # Batches usually share one response schema, so each distinct keyset is
+    # merged into all_fields once and repeats cost a single set lookup.
     all_fields = set()
+    seen_shapes = set()
 
     for result in results:
         response = result.get('response', {})
 
         if isinstance(response, dict):
-            # Flatten nested objects
-            flattened_response = flatten_nested_dict(response)
-
-            # Collect field names (excluding schema fields)
-            for field_name in flattened_response.keys():
-                if field_name not in schema_fields:
-                    all_fields.add(field_name)
+            keys = frozenset(flatten_nested_dict(response, list_mode='str'))
+            if keys not in seen_shapes:
+                seen_shapes.add(keys)
+                all_fields.update(keys - SCHEMA_METADATA_FIELDS)
         else:
-            flattened_response = {'raw_response': str(response)}
             all_fields.add('raw_response')
 
-        flattened_results.append({
-            'record_id': result['record_id'],
-            'flattened_response': flattened_response
-        })
-
-    # Sort fields for consistent column order
-    sorted_fields = sorted(all_fields)
+    # Sort fields for consistent column order (tuple: iterated once per row)
+    sorted_fields = tuple(sorted(all_fields))
 
     # Write header: Use actual record ID field name instead of generic "Record ID"
     record_id_header = record_id_field if record_id_field else 'Record ID'
-    header = [record_id_header] + sorted_fields
-    writer.writerow(header)
-
-    # Write data rows
-    for result in flattened_results:
-        record_id = result['record_id']
-        flattened_response = result['flattened_response']
-
-        row = [record_id]
-
-        # Add each field value in the same order as header
-        for field_name in sorted_fields:
-            value = flattened_response.get(field_name, '')
-
-            # Convert to string
-            if value is None:
-                value_str = ''
+    writer.writerow((record_id_header,) + sorted_fields)
+
+    # Second pass: re-flatten each response and yield its row. Flattening
+    # twice costs less than retaining O(records x fields) dicts in memory,
+    # and writerows drains the generator inside the C csv writer instead of
+    # paying a Python-level writerow call per record.
+    def _rows():
+        for result in results:
+            response = result.get('response', {})
+
+            if isinstance(response, dict):
+                # list_mode='str': CSV cells only need a display value, so
+                # skip the JSON encode for list fields
+                flattened = flatten_nested_dict(response, list_mode='str')
             else:
-                value_str = str(value)
-
-            row.append(value_str)
-
-        writer.writerow(row)
+                flattened = {'raw_response': str(response)}
+
+            # Field values in the same order as the header. Most LLM response
+            # values are already strings, so skip the str() call for those.
+            yield [result['record_id']] + [
+                '' if (value := flattened.get(field_name)) is None
+                else value if type(value) is str
+                else str(value)
+                for field_name in sorted_fields
+            ]
+
+    writer.writerows(_rows())
 
     return output.getvalue()
@@ -3,6 +3,30 @@ JSON utility functions for parsing and cleaning LLM responses
 """
 import json
 
+# Prefer orjson for the parse/serialize calls that run once per record in the
+# LLM response path; fall back to stdlib json when it isn't installed
+try:
+    import orjson
+
+    json_loads = orjson.loads
+
+    def json_dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+except ImportError:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+
+# Incremental scanning needs raw_decode, which orjson doesn't expose
+_JSON_DECODER = json.JSONDecoder()
+
+# JSON Schema metadata keys stripped from LLM responses; shared with the CSV
+# utilities so the set is built once at import instead of per call
+SCHEMA_METADATA_FIELDS = frozenset({
+    '$schema', 'type', 'properties', 'required', 'title', 'description',
+    'definitions', 'additionalProperties', '$id', '$ref', 'items'
+})
+
 
 def extract_json_from_llm_response(response: str) -> str:
     """
@@ -13,45 +37,35 @@ def extract_json_from_llm_response(response: str) -> str:
     - Markdown code blocks (```json ... ```)
     - Extra explanatory text before/after JSON
 
-    Strategy: Find the last '}' and work backwards to find its matching '{'.
-    This assumes the JSON object is the last thing in the response.
+    Strategy: Scan forward through each '{' with raw_decode — the
+    C-implemented scanner — keeping the last object that parses, so the
+    trailing JSON object wins just like the old backwards brace walk but
+    without the per-character Python loop.
 
     Returns cleaned JSON string ready for parsing.
     """
-    # Find the last '}' in the response
-    last_brace = response.rfind('}')
-    if last_brace == -1:
-        # No closing brace found, return as-is
+    parsed = None
+    idx = response.find('{')
+    while idx != -1:
+        try:
+            obj, end = _JSON_DECODER.raw_decode(response, idx)
+        except json.JSONDecodeError:
+            idx = response.find('{', idx + 1)
+            continue
+        if isinstance(obj, dict):
+            parsed = obj
+        idx = response.find('{', end)
+
+    if parsed is None:
+        # No parseable object found, return as-is
         return response.strip()
 
-    # Work backwards to find the matching '{'
-    brace_count = 0
-    for i in range(last_brace, -1, -1):
-        if response[i] == '}':
-            brace_count += 1
-        elif response[i] == '{':
-            brace_count -= 1
-            if brace_count == 0:
-                # Found the matching opening brace
-                json_str = response[i:last_brace+1]
-
-                # Parse and clean the JSON to remove schema metadata
-                try:
-                    parsed = json.loads(json_str)
-                    # Remove JSON schema fields if they exist
-                    schema_fields = {'$schema', 'type', 'properties', 'required', 'title',
-                                   'description', 'definitions', 'additionalProperties', '$id', '$ref', 'items'}
-                    cleaned = {k: v for k, v in parsed.items() if k not in schema_fields}
-                    return json.dumps(cleaned)
-                except json.JSONDecodeError:
-                    # If parsing fails, return as-is
-                    return json_str
-
-    # If no matching brace found, return original
-    return response.strip()
-
-
-def flatten_nested_dict(obj, parent_key='', sep='.'):
+    # Remove JSON schema fields if they exist
+    cleaned = {k: v for k, v in parsed.items() if k not in SCHEMA_METADATA_FIELDS}
+    return json_dumps(cleaned)
+
+
+def flatten_nested_dict(obj, parent_key='', sep='.', list_mode='json'):
     """
     Flatten a nested dictionary into dot-notation keys.
     Example: {'a': {'b': 1}} -> {'a.b': 1}
@@ -60,26 +74,35 @@ def flatten_nested_dict(obj, parent_key='', sep='.'):
         obj: Dictionary or value to flatten
         parent_key: Parent key for recursion
         sep: Separator for nested keys (default: '.')
+        list_mode: How to render list values — 'json' serializes them to JSON
+            strings, 'str' uses the cheaper str() when the caller only needs
+            a display value (e.g. CSV cells)
 
     Returns:
         Flattened dictionary
     """
-    items = []
+    # Iterative traversal with an explicit stack: recursion built and merged
+    # an intermediate dict per nesting level, which adds up when this runs
+    # once per record in the CSV path. Everything writes into one output dict.
+    flattened = {}
 
-    if isinstance(obj, dict):
-        for key, value in obj.items():
-            new_key = f"{parent_key}{sep}{key}" if parent_key else key
+    if not isinstance(obj, dict):
+        # Not a dict, return as-is
+        flattened[parent_key] = obj
+        return flattened
+
+    stack = [(parent_key, obj)]
+    while stack:
+        prefix, current = stack.pop()
+        for key, value in current.items():
+            new_key = f"{prefix}{sep}{key}" if prefix else key
 
             if isinstance(value, dict):
-                # Recursively flatten nested dicts
-                items.extend(flatten_nested_dict(value, new_key, sep=sep).items())
+                stack.append((new_key, value))
             elif isinstance(value, list):
-                # Convert lists to JSON strings (can't easily flatten arrays)
-                items.append((new_key, json.dumps(value)))
+                # Convert lists to strings (can't easily flatten arrays)
+                flattened[new_key] = str(value) if list_mode == 'str' else json_dumps(value)
             else:
-                items.append((new_key, value))
-    else:
-        # Not a dict, return as-is
-        items.append((parent_key, obj))
+                flattened[new_key] = value
 
-    return dict(items)
+    return flattened
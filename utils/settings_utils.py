@@ -0,0 +1,79 @@
+"""
+Settings file access shared by the app and routes
+"""
+import json
+import os
+import tempfile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SETTINGS_FILE = 'settings.json'
+
+# Parsed settings cached against the file's mtime: the settings endpoint is
+# polled by the UI and load_settings runs per batch/preview, so the hot path
+# should cost one stat() instead of a read + JSON parse every time
+_settings_cache = {'mtime': None, 'data': None}
+
+
+def _default_settings():
+    """Default settings from environment when settings.json doesn't exist"""
+    return {
+        'provider': os.getenv('LLM_PROVIDER', 'lm_studio'),
+        'endpoint': os.getenv('LM_STUDIO_ENDPOINT', 'http://localhost:1234'),
+        'model': os.getenv('LLM_MODEL', 'gpt-4o-mini'),
+        'temperature': float(os.getenv('LLM_TEMPERATURE', '0.7')),
+        'max_tokens': int(os.getenv('LLM_MAX_TOKENS', '4000')),
+        'timeout': 60
+    }
+
+
+def load_settings(settings_file=SETTINGS_FILE):
+    """Load settings, re-reading the file only when its mtime changes
+
+    Callers should treat the returned dict as read-only; it is shared
+    between requests until the file changes on disk.
+    """
+    try:
+        mtime = os.stat(settings_file).st_mtime_ns
+    except OSError:
+        return _default_settings()
+
+    if _settings_cache['mtime'] == mtime:
+        return _settings_cache['data']
+
+    with open(settings_file, 'r') as f:
+        settings = json.load(f)
+
+    _settings_cache['mtime'] = mtime
+    _settings_cache['data'] = settings
+    return settings
+
+
+def save_settings(data, settings_file=SETTINGS_FILE):
+    """Write settings atomically: serialize to a temp file, then os.replace
+
+    A crash mid-write can no longer truncate settings.json, and readers
+    always see either the old or the new file.
+    """
+    if orjson:
+        payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    else:
+        payload = json.dumps(data, indent=2).encode('utf-8')
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(settings_file) or '.',
+                                    prefix='.settings-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, settings_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    # Keep the cache in sync so the next load skips the re-read
+    _settings_cache['mtime'] = os.stat(settings_file).st_mtime_ns
+    _settings_cache['data'] = data